@@ -5,46 +5,76 @@ Contains the following functions:
 
 2. behavior_nearest_loc: This function will return the
 index (array location) for the value in fluor_array that
-is closest in value to each row in behav_array.
+is closest in value to each row in behav_array. It uses
+nearest_index, which finds all of them in one binary search.
 
 3. behavior_nearest_value: This function will give the value in
 fluor_array that is closest to the value for each row in behav_array.
+align_events gives the locations, values and alignment error
+for the starts and stops of a behavior with one search, and
+align_behaviors does the same for every behavior in a session.
 
 4. area_under_curve: This function will give the mean
-fluroescence for all events of a behavior.
+fluroescence for all events of a behavior. event_auc also gives
+the mean and trapezoidal area of each event.
 
 5. behavior_fluor: This function will give the normalized fluorescence
 values during each behavior event.
 
 6. baseline_fluor: This function will give the normalized fluorescence
-values during the baseline period.
+values during the baseline period. epochs and window_matrix give the
+windows of every event as one NaN padded (events x samples) array.
 
 7. base_mean: This function will give the mean value of the baseline.
 
 8. baselinestd: This function will give the standard
-deviation of the baseline period.
+deviation of the baseline period. SignalSummary and baseline_stats
+give the mean and standard deviation of any window in O(1).
 
 9. event_z: This function will give the zscore values
 for each value in behavior_fluor.
 
 10. zscpre_max: This function will give the maximum
 zscore value and location of the max zscore.
+
+11. event_metrics: This function will give the peak zscore, time to
+peak, onset latency, area above baseline and decay half-time of every
+event. trace_metrics gives the same for the mean zscore trace.
+
+12. statistics: This function will read the files of one behavior
+and give its auc and max zscore, optionally adding them to a
+results.ResultsWriter. behavior_statistics does the same from arrays
+already in memory.
+
+The alignment, window, baseline, auc and zscore functions are wrapped
+with memo.memoize, so once memo.enable() is called they are not
+computed again for the same inputs.
 """
 
 
+import os
 import sys
 import numpy as np
-import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+import memo
+import readers
+import results
+import timebase
 
 
-def file2numpy(file_path):
+def file2numpy(file_path, backend=None):
     """
     Objective: To take the given file and convert to a numpy array.
 
     Parameters
     ----------
     file_path: str
-        This will provide the file path needed.
+        This will provide the file path needed. An array (such as the
+        times from boris.load_boris) is returned as a float array.
+
+    backend: str
+        The text reader from readers.BACKENDS to use.
+        Defaults to readers.DEFAULT_BACKEND.
 
 
     Returns
@@ -52,10 +82,67 @@ def file2numpy(file_path):
     array: list
         This is a numpy array.
     """
-    array = np.loadtxt(file_path, dtype=float)
+    if not isinstance(file_path, (str, os.PathLike)):
+        return np.asarray(file_path, dtype=float)
+    array = readers.read_array(file_path, backend)
     return array
 
 
+def nearest_index(fluor_array, behav_array, flag_outside=False):
+    """
+    Objective: Find the array location for the value in fluor_array that
+    is closest in value to each value in behav_array, using a binary
+    search so all events are found in one call.
+
+    Parameters
+    ----------
+    fluor_array: list
+        This numpy array contains of all the time points corresponding
+        to the green channel. It must be sorted in increasing order.
+
+    behav_array: list
+        This numpy array contains all of the
+        start times when the behavior occurred.
+
+    flag_outside: bool
+        If True, also return which events are inside the recording.
+
+
+    Returns
+    -------
+    near_loc: array
+        This array of integers contains the array location in fluor_array
+        closest to each value in behav_array. As with argmin, a tie goes
+        to the earlier location.
+
+    inside: array
+        Only returned if flag_outside is True. This boolean array is False
+        for the events before the first or after the last time point.
+    """
+    fluor_array = np.asarray(fluor_array, dtype=float).ravel()
+    behav_array = np.atleast_1d(np.asarray(behav_array, dtype=float)).ravel()
+    if len(fluor_array) == 0:
+        raise ValueError("fluor_array should not be empty")
+    if len(fluor_array) == 1:
+        near_loc = np.zeros(len(behav_array), dtype=np.intp)
+    else:
+        right = np.searchsorted(fluor_array, behav_array, side='left')
+        right = np.clip(right, 1, len(fluor_array) - 1)
+        left = right - 1
+        closer = (np.abs(fluor_array[right] - behav_array) <
+                  np.abs(fluor_array[left] - behav_array))
+        near_loc = np.where(closer, right, left)
+        # argmin gives the first of repeated time points
+        near_loc = np.searchsorted(fluor_array, fluor_array[near_loc],
+                                   side='left')
+        near_loc[np.isnan(behav_array)] = 0
+    if flag_outside:
+        inside = ((behav_array >= fluor_array[0]) &
+                  (behav_array <= fluor_array[-1]))
+        return near_loc, inside
+    return near_loc
+
+
 def behavior_nearest_loc(fluor_array, behav_array):
     """
     Objective: Find the array location for the value in fluor_array that
@@ -78,6 +165,10 @@ def behavior_nearest_loc(fluor_array, behav_array):
         This list of integers contains the array location where the value for
         each row in behav_array is closest in value to that in fluor_array.
     """
+    fluor_array = np.asarray(fluor_array)
+    if np.all(np.diff(fluor_array.ravel()) >= 0):
+        return list(nearest_index(fluor_array, behav_array))
+    # unsorted time points need the full search
     near_loc = []
     for x in np.nditer(behav_array):
         loc = (np.abs(fluor_array - x)).argmin()
@@ -107,6 +198,10 @@ def behavior_nearest_value(fluor_array, behav_array):
         This list of floats contains the value in fluor_array
         that is cloest to each value in behav_array.
     """
+    fluor_array = np.asarray(fluor_array)
+    if np.all(np.diff(fluor_array.ravel()) >= 0):
+        return list(fluor_array[nearest_index(fluor_array, behav_array)])
+    # unsorted time points need the full search
     near_value = []
     for x in behav_array:
         n = [abs(i - x) for i in fluor_array]
@@ -115,6 +210,190 @@ def behavior_nearest_value(fluor_array, behav_array):
     return near_value
 
 
+@memo.memoize
+def align_events(fluor_array, behav_start_array, behav_stop_array):
+    """
+    Objective: To find the nearest location, the nearest time point and
+    the alignment error for the start and stop of every event with a
+    single search, instead of calling behavior_nearest_loc and
+    behavior_nearest_value for the starts and again for the stops.
+
+    Parameters
+    ----------
+    fluor_array: list
+        This numpy array contains of all the time points corresponding
+        to the green channel. It must be sorted in increasing order.
+
+    behav_start_array: list
+        This numpy array contains all of the
+        start times when the behavior occurred.
+
+    behav_stop_array: list
+        This numpy array contains all of the
+        stop times when the behavior occurred.
+
+
+    Returns
+    -------
+    alignment: dict
+        This dict holds arrays with the location in fluor_array
+        ('start_loc', 'stop_loc'), the time point at that location
+        ('start_time', 'stop_time') and the time point minus the event
+        time in ms ('start_error', 'stop_error') for every event.
+    """
+    fluor_array = np.asarray(fluor_array, dtype=float).ravel()
+    starts = np.atleast_1d(np.asarray(behav_start_array, dtype=float)).ravel()
+    stops = np.atleast_1d(np.asarray(behav_stop_array, dtype=float)).ravel()
+    events = np.concatenate([starts, stops])
+    near_loc = nearest_index(fluor_array, events)
+    near_time = fluor_array[near_loc]
+    error = near_time - events
+    n = len(starts)
+    return {'start_loc': near_loc[:n], 'stop_loc': near_loc[n:],
+            'start_time': near_time[:n], 'stop_time': near_time[n:],
+            'start_error': error[:n], 'stop_error': error[n:]}
+
+
+@memo.memoize
+def align_behaviors(fluor_array, events, behaviors=None, timebase=None):
+    """
+    Objective: To align the starts and stops of every behavior in a
+    session with one search over all of their events.
+
+    Parameters
+    ----------
+    fluor_array: list
+        This numpy array contains of all the time points corresponding
+        to the green channel. It must be sorted in increasing order.
+
+    events: BehaviorEvents
+        The events of every behavior, from boris.load_boris.
+
+    behaviors: list
+        The behaviors to align, for example from
+        boris.behaviors_from_config. Defaults to all of them.
+
+    timebase: Timebase
+        If given, its arithmetic lookup is used instead of the search.
+
+
+    Returns
+    -------
+    alignments: dict
+        This dict holds the align_events result for each behavior.
+        Behaviors without events get empty arrays.
+    """
+    if behaviors is None:
+        behaviors = events.behaviors
+    fluor_array = np.asarray(fluor_array, dtype=float).ravel()
+    counts = np.diff(events.offsets)
+    chosen = np.isin(events.behaviors, list(behaviors))
+    keep = np.repeat(chosen, counts)
+    starts, stops = events.start[keep], events.stop[keep]
+    times = np.concatenate([starts, stops])
+    if timebase is None:
+        near_loc = nearest_index(fluor_array, times)
+    else:
+        near_loc = timebase.index(times)
+    near_time = fluor_array[near_loc]
+    error = near_time - times
+
+    # split the starts and stops back into behaviors
+    n = len(starts)
+    bounds = np.cumsum(counts[chosen])[:-1]
+    found = [behavior for behavior, on in zip(events.behaviors, chosen) if on]
+    arrays = {'start_loc': near_loc[:n], 'stop_loc': near_loc[n:],
+              'start_time': near_time[:n], 'stop_time': near_time[n:],
+              'start_error': error[:n], 'stop_error': error[n:]}
+    pieces = {key: dict(zip(found, np.split(array, bounds)))
+              for key, array in arrays.items()}
+    alignments = {}
+    for behavior in behaviors:
+        alignments[behavior] = {key: pieces[key].get(behavior, array[:0])
+                                for key, array in arrays.items()}
+    return alignments
+
+
+def _slice_bounds(x, y, n):
+    """
+    Objective: To turn the starts and stops of normsig[x:y] slices into
+    the bounds Python slicing would use for a sequence of length n.
+    """
+    x = np.asarray(x, dtype=np.int64)
+    y = np.asarray(y, dtype=np.int64)
+    x = np.clip(np.where(x < 0, x + n, x), 0, n)
+    y = np.clip(np.where(y < 0, y + n, y), 0, n)
+    return x, np.maximum(y, x)
+
+
+@memo.memoize
+def event_auc(behav_start_loc, behav_stop_loc, normsig, times=None,
+              scale=1000.0):
+    """
+    Objective: To find the fluorescence during every event of a behavior
+    from one cumulative sum of normsig, so each event costs O(1).
+
+    Parameters
+    ----------
+    behav_start_loc: list
+        This list of integers contains the array location
+        in norm sig for the start of a behavior event.
+
+    behav_stop_loc: list
+        This list of integers contains the array location
+        in norm sig for the stop of a behavior event.
+
+    normsig: list
+        This numpy array contains the normalized
+        fluroescent values for the green channel.
+
+    times: list
+        The time points of normsig (fTimeGreen). If given, the
+        trapezoidal area under normsig is found for each event.
+
+    scale: float
+        The number of time point units in one second.
+
+
+    Returns
+    -------
+    auc: dict
+        This dict holds the mean over all events ('mean', what
+        area_under_curve returns), and for each event its sum
+        ('event_sums'), number of samples ('event_lengths') and
+        mean ('event_means'). If times is given it also holds the
+        area under normsig in seconds for each event ('event_areas').
+    """
+    if (len(behav_start_loc) != len(behav_stop_loc)):
+        raise ValueError(f"behav_start_loc and behav_stop_loc should be equal")
+    normsig = np.asarray(normsig, dtype=float).ravel()
+    cumsum = np.concatenate([[0.0], np.cumsum(normsig)])
+    # each event includes its stop sample
+    x, y = _slice_bounds(behav_start_loc, np.asarray(behav_stop_loc) + 1,
+                         len(normsig))
+    event_sums = cumsum[y] - cumsum[x]
+    event_lengths = y - x
+    total_len = event_lengths.sum()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        event_means = event_sums / event_lengths
+        mean = event_sums.sum() / total_len if total_len else np.nan
+    auc = {'mean': mean, 'event_sums': event_sums,
+           'event_lengths': event_lengths, 'event_means': event_means}
+
+    if times is not None:
+        times = np.asarray(times, dtype=float).ravel()
+        n = min(len(times), len(normsig))
+        # area of each trapezoid between neighbouring samples
+        pieces = ((normsig[1:n] + normsig[:n-1]) / 2 *
+                  np.diff(times[:n]) / scale)
+        area = np.concatenate([[0.0], np.cumsum(pieces)])
+        first = np.minimum(x, n - 1)
+        last = np.clip(y - 1, first, n - 1)
+        auc['event_areas'] = np.where(event_lengths > 0,
+                                      area[last] - area[first], 0.0)
+    return auc
+
+
 def area_under_curve(behav_start_loc, behav_stop_loc, normsig):
     """
     Objective: To find the mean fluorescence value during the behavior.
@@ -138,18 +417,9 @@ def area_under_curve(behav_start_loc, behav_stop_loc, normsig):
     -------
     mean: float
         This single float is the mean fluorescence value for the behavior.
+        See event_auc for the value of each event.
     """
-    if (len(behav_start_loc) != len(behav_stop_loc)):
-        raise Error(f"behav_start_loc and behav_stop_loc should be equal")
-    new_list = [x+1 for x in behav_stop_loc]
-    num_events = len(behav_start_loc)
-    total_len, total_sum = 0, 0
-    for i in range(num_events):
-        x, y = behav_start_loc[i], new_list[i]
-        total_sum += sum(normsig[x:y])
-        total_len += len(normsig[x:y])
-        mean = total_sum / total_len
-    return mean
+    return event_auc(behav_start_loc, behav_stop_loc, normsig)['mean']
 
 
 # below functions are for zscores
@@ -225,6 +495,281 @@ def baseline_fluor(behav_start_loc, behav_stop_loc, normsig, timeprior):
     return baseline_fluor
 
 
+def _gather_windows(normsig, first, length):
+    """
+    Objective: To stack normsig[first[i]:first[i]+length] for every i,
+    with nan wherever a window runs off either end of normsig.
+    """
+    normsig = np.asarray(normsig, dtype=float).ravel()
+    first = np.asarray(first, dtype=np.int64).ravel()
+    n = len(normsig)
+    if len(first) == 0 or length <= 0:
+        return np.empty((len(first), max(length, 0)))
+    if first.min() >= 0 and first.max() + length <= n:
+        # every window is inside normsig, so read them from a view of it
+        return sliding_window_view(normsig, length)[first]
+    before = int(min(max(-first.min(), 0), length))
+    after = int(min(max(first.max() + length - n, 0), length))
+    first = np.clip(first + before, 0, n + before + after - length)
+    padded = np.concatenate([np.full(before, np.nan), normsig,
+                             np.full(after, np.nan)])
+    return sliding_window_view(padded, length)[first]
+
+
+@memo.memoize
+def epochs(normsig, behav_loc, pre=0, post=300):
+    """
+    Objective: To find the normalized fluorescence around every event
+    as one array, with a column for each sample from pre samples before
+    to post samples after the event.
+
+    Parameters
+    ----------
+    normsig: list
+        This numpy array contains the normalized
+        fluroescent values for the green channel.
+
+    behav_loc: list
+        This list of integers contains the array location
+        in norm sig of each behavior event.
+
+    pre: int
+        The number of samples before each event.
+
+    post: int
+        The number of samples from the event on. With pre=0 and
+        post=timeafter the rows are the windows of behavior_fluor.
+
+
+    Returns
+    -------
+    epoch_fluor: array
+        This (events x pre+post) array holds normsig[loc-pre:loc+post]
+        for each event. Samples before the start or after the end of
+        normsig are nan, so each column is the same lag for every event.
+
+    valid: array
+        This boolean array, the shape of epoch_fluor,
+        is False for the nan padding.
+    """
+    normsig = np.asarray(normsig, dtype=float).ravel()
+    first = np.asarray(behav_loc, dtype=np.int64).ravel() - pre
+    length = pre + post
+    epoch_fluor = _gather_windows(normsig, first, length)
+    position = first[:, None] + np.arange(max(length, 0))
+    valid = (position >= 0) & (position < len(normsig))
+    return epoch_fluor, valid
+
+
+@memo.memoize
+def window_matrix(normsig, x, y):
+    """
+    Objective: To stack the windows normsig[x:y] of every event as one
+    array, with Python slicing rules. This is the array pandas makes from
+    the lists that behavior_fluor and baseline_fluor return.
+
+    Parameters
+    ----------
+    normsig: list
+        This numpy array contains the normalized
+        fluroescent values for the green channel.
+
+    x: list
+        The array location where each window starts.
+
+    y: list
+        The array location where each window stops (not included).
+
+
+    Returns
+    -------
+    window_fluor: array
+        This (events x longest window) array holds each window from its
+        first column on, with nan after the end of shorter windows.
+
+    valid: array
+        This boolean array, the shape of window_fluor,
+        is False for the nan padding.
+    """
+    normsig = np.asarray(normsig, dtype=float).ravel()
+    x, y = _slice_bounds(x, y, len(normsig))
+    lengths = (y - x).ravel()
+    length = int(lengths.max()) if len(lengths) else 0
+    window_fluor = _gather_windows(normsig, x.ravel(), length)
+    valid = np.arange(length) < lengths[:, None]
+    if not valid.all():
+        window_fluor = np.where(valid, window_fluor, np.nan)
+    return window_fluor, valid
+
+
+class SignalSummary:
+    """
+    Cumulative sums of a signal and of its squares, so the mean and
+    standard deviation of any window normsig[x:y] take O(1). The sums
+    are of the signal minus its overall mean, which keeps the sums of
+    squares small and avoids losing precision when they are subtracted.
+    Build it once per session and share it between behaviors.
+
+    Parameters
+    ----------
+    normsig: list
+        This numpy array contains the normalized
+        fluroescent values for the green channel.
+    """
+    __slots__ = ('shift', 'cumsum', 'cumsum_sq')
+
+    def __init__(self, normsig):
+        normsig = np.asarray(normsig, dtype=float).ravel()
+        self.shift = normsig.mean() if len(normsig) else 0.0
+        centered = normsig - self.shift
+        self.cumsum = np.concatenate([[0.0], np.cumsum(centered)])
+        self.cumsum_sq = np.concatenate([[0.0], np.cumsum(centered**2)])
+
+    def __len__(self):
+        return len(self.cumsum) - 1
+
+    def window(self, x, y, ddof=1):
+        """
+        Objective: To find the mean and standard deviation of every
+        window normsig[x:y], with Python slicing rules.
+
+        Parameters
+        ----------
+        x: array
+            The start location of each window.
+
+        y: array
+            The stop location of each window (not included).
+
+        ddof: int
+            The delta degrees of freedom of the standard deviation.
+            The default of 1 is what pandas uses.
+
+
+        Returns
+        -------
+        mean: array
+            The mean of each window, nan if it is empty.
+
+        std: array
+            The standard deviation of each window,
+            nan if it has ddof samples or fewer.
+
+        length: array
+            The number of samples in each window.
+        """
+        x, y = _slice_bounds(x, y, len(self))
+        length = y - x
+        sums = self.cumsum[y] - self.cumsum[x]
+        sums_sq = self.cumsum_sq[y] - self.cumsum_sq[x]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            centered_mean = sums / length
+            var = (sums_sq - sums * centered_mean) / (length - ddof)
+        var[length <= ddof] = np.nan
+        std = np.sqrt(np.maximum(var, 0.0), where=~np.isnan(var),
+                      out=np.full(len(var), np.nan))
+        return centered_mean + self.shift, std, length
+
+
+@memo.memoize
+def baseline_stats(behav_start_loc, behav_stop_loc, normsig, timeprior,
+                   summary=None):
+    """
+    Objective: To find the mean and standard deviation of every baseline
+    window that baseline_fluor would slice out, without slicing.
+
+    Parameters
+    ----------
+    behav_start_loc: list
+        This list of integers contains the array location
+        in norm sig for the start of a behavior event.
+
+    behav_stop_loc: list
+        This list of integers contains the array location
+        in norm sig for the stop of a behavior event.
+
+    normsig: list
+        This numpy array contains the normalized
+        fluroescent values for the green channel.
+
+    timeprior: int
+        The number of samples before behav_stop_loc where each baseline
+        starts, as in baseline_fluor.
+
+    summary: SignalSummary
+        The summary of normsig. Pass it in to share it between
+        behaviors; otherwise it is built here.
+
+
+    Returns
+    -------
+    stats: dict
+        This dict holds the mean ('means'), standard deviation ('stds',
+        ddof=1) and number of samples ('lengths') of each baseline
+        window, and the mean of all the baseline samples together
+        ('mean'). When every window has the same length 'mean' equals
+        base_mean of the baseline_fluor windows.
+    """
+    if summary is None:
+        summary = SignalSummary(normsig)
+    x = np.asarray(behav_stop_loc, dtype=np.int64) - timeprior
+    means, stds, lengths = summary.window(x, behav_start_loc)
+    total = lengths.sum()
+    mean = (np.nansum(means * lengths) / total) if total else np.nan
+    return {'mean': mean, 'means': means, 'stds': stds, 'lengths': lengths}
+
+
+def pad_windows(windows):
+    """
+    Objective: To stack ragged windows, like the lists from behavior_fluor
+    and baseline_fluor, into one array with nan after the end of shorter
+    windows. An (events x samples) array is returned as it is.
+    """
+    if isinstance(windows, np.ndarray) and windows.ndim == 2:
+        return windows
+    windows = [np.asarray(window, dtype=float).ravel() for window in windows]
+    lengths = np.array([len(window) for window in windows], dtype=np.int64)
+    length = int(lengths.max()) if len(lengths) else 0
+    padded = np.full((len(windows), length), np.nan)
+    if length:
+        padded[np.arange(length) < lengths[:, None]] = np.concatenate(windows)
+    return padded
+
+
+def _column_means(windows):
+    """
+    Objective: To find the mean of each column, skipping nan,
+    as DataFrame.mean does. Columns with no values are nan.
+    """
+    counts = (~np.isnan(windows)).sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.nansum(windows, axis=0) / counts
+
+
+def _column_stds(windows, ddof=1):
+    """
+    Objective: To find the standard deviation of each column, skipping
+    nan, as DataFrame.std does. Columns with ddof or fewer values are nan.
+    """
+    counts = (~np.isnan(windows)).sum(axis=0)
+    deviations = np.nan_to_num(windows - _column_means(windows))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        variance = (deviations**2).sum(axis=0) / (counts - ddof)
+    variance[counts <= ddof] = np.nan
+    return np.sqrt(variance)
+
+
+def windows_frame(windows):
+    """
+    Objective: To give ragged or padded windows as a pandas DataFrame,
+    one row per event, for saving or plotting. pandas is only imported
+    here, so the rest of the module does not need it.
+    """
+    import pandas as pd
+    return pd.DataFrame(pad_windows(windows))
+
+
+@memo.memoize
 def base_mean(baseline_fluor):
     """
     Objective: To find the mean of the baseline period.
@@ -233,7 +778,8 @@ def base_mean(baseline_fluor):
     ----------
     baseline_fluor: array
         This array contains the normalized fluorescence
-        values for the baseline.
+        values for the baseline, as a list or an
+        (events x samples) array with nan padding.
 
 
     Returns
@@ -241,12 +787,15 @@ def base_mean(baseline_fluor):
     baseline_mean: float
         A single float which is the mean of the baseline.
     """
-    df = pd.DataFrame(baseline_fluor)
-    baseline_mean = df.mean()
+    baseline_mean = _column_means(pad_windows(baseline_fluor))
+    if len(baseline_mean) == 0:
+        # no baseline sample is inside the recording
+        return np.nan
     baseline_mean = sum(baseline_mean)/len(baseline_mean)
     return baseline_mean
 
 
+@memo.memoize
 def baselinestd(baseline_fluor):
     """
     Objective: To find the mean standard deviation of the baseline.
@@ -255,7 +804,8 @@ def baselinestd(baseline_fluor):
     ----------
     baseline_fluor: array
         This array contains the normalized fluorescence
-        values for the baseline.
+        values for the baseline, as a list or an
+        (events x samples) array with nan padding.
 
 
     Returns
@@ -265,9 +815,10 @@ def baselinestd(baseline_fluor):
         This is done by getting the standard deviation of all the baseline
         events and then taking the mean of all the standard deviations.
     """
-    df = pd.DataFrame(baseline_fluor)
-    base_std = df.std()
-    mean_base_std = base_std.mean()
+    base_std = _column_stds(pad_windows(baseline_fluor))
+    if np.isnan(base_std).all():
+        return np.nan
+    mean_base_std = np.nanmean(base_std)
     return mean_base_std
 
 
@@ -279,7 +830,8 @@ def event_z(event_fluor, baseline_mean, mean_base_std):
     ----------
     event_fluor: array
         This array contains the normalized fluorescence
-        values during each behavior event.
+        values during each behavior event, as a list
+        or an (events x samples) array from epochs.
 
     baseline_mean: float
         A single float which is the mean of the baseline.
@@ -295,64 +847,188 @@ def event_z(event_fluor, baseline_mean, mean_base_std):
     event_zscores: array
         This array contains the zscores for event.
     """
+    if isinstance(event_fluor, np.ndarray):
+        return (event_fluor - baseline_mean) / mean_base_std
     event_zscores = []
     for x in event_fluor:
         event_zscores.append((x - baseline_mean) / mean_base_std)
     return event_zscores
 
 
-def zscore_max(event_zscores):
+@memo.memoize
+def zscore_max(event_zscores, sample_rate=60):
     """
     Objective: To find the max zscore value and location of the max zscore.
 
     Parameters
     ----------
     event_zscores: array
-        This array contains the zscores for event.
+        This array contains the zscores for event, as a list or an
+        (events x samples) array with nan padding.
+
+    sample_rate: float
+        The samples per second of the signal, used to turn the location
+        into seconds. Timebase.sample_rate gives the measured rate.
 
 
     Returns
     -------
     max_zscore: float
         This float is the max zscore value for the event.
+
+    idx_sec: float
+        This float is the location of the max zscore in seconds.
     """
-    df = pd.DataFrame(event_zscores)
-    row_means = df.mean(axis=0)
-    row_means = row_means.to_list()
-    max_zscore = max(row_means)
-    index = row_means.index(max_zscore)
-    idx_sec = index/60
+    row_means = _column_means(pad_windows(event_zscores))
+    if np.isnan(row_means).all():
+        return np.nan, 0.0
+    index = int(np.nanargmax(row_means))
+    max_zscore = float(row_means[index])
+    idx_sec = index/sample_rate
     return max_zscore, idx_sec
 
 
-def statistics(fTimeGreen_path, behav_start_time_path, behav_stop_time_path, normsig_path):
+def event_metrics(event_zscores, sample_rate=60, threshold=1.0, pre=0):
+    """
+    Objective: To find the peak, latency, area and decay of the zscore
+    during every event at once.
 
-    fluor_array = file2numpy(fTimeGreen_path)
+    Parameters
+    ----------
+    event_zscores: array
+        This array contains the zscores for event, as a list or an
+        (events x samples) array with nan padding.
+
+    sample_rate: float
+        The samples per second of the signal, used to turn
+        locations into seconds.
 
-    behav_start_array = file2numpy(behav_start_time_path)
-    # print(behav_start_array)
-    behav_stop_array = file2numpy(behav_stop_time_path)
-    # print(behav_stop_array)
-    sages2ndFit = file2numpy(normsig_path)
-    # print(behav_stop_array)
+    threshold: float
+        The zscore the onset latency is measured to.
+
+    pre: int
+        The number of samples before the event at the start of each row,
+        as in epochs. Only samples from the event on are measured, and
+        times are from the event.
+
+
+    Returns
+    -------
+    metrics: dict
+        This dict holds an array with a value for each event:
+        'peak' is the max zscore, 'time_to_peak' the seconds to it,
+        'onset_latency' the seconds to the first zscore at or above
+        threshold, 'area' the area of the zscore above 0 in zscore
+        seconds and 'decay_half_time' the seconds from the peak until
+        the zscore first falls to half the peak. Events with no values,
+        or that never reach threshold or half the peak, are nan.
+    """
+    post = pad_windows(event_zscores)[:, pre:]
+    length = post.shape[1]
+    values = ~np.isnan(post)
+    has_values = values.any(axis=1)
+    rows = np.arange(len(post))
+    lags = np.arange(length)
+
+    peak_loc = np.where(values, post, -np.inf).argmax(axis=1)
+    peak = np.where(has_values, post[rows, peak_loc], np.nan)
+    time_to_peak = np.where(has_values, peak_loc / sample_rate, np.nan)
+
+    above = post >= threshold
+    onset_latency = np.where(above.any(axis=1),
+                             above.argmax(axis=1) / sample_rate, np.nan)
+
+    area = np.where(has_values,
+                    np.nansum(np.clip(post, 0, None), axis=1) / sample_rate,
+                    np.nan)
+
+    with np.errstate(invalid='ignore'):
+        decayed = (lags > peak_loc[:, None]) & (post <= peak[:, None] / 2)
+    decay = np.where(decayed.any(axis=1) & (peak > 0),
+                     (decayed.argmax(axis=1) - peak_loc) / sample_rate,
+                     np.nan)
+    return {'peak': peak, 'time_to_peak': time_to_peak,
+            'onset_latency': onset_latency, 'area': area,
+            'decay_half_time': decay}
+
+
+def trace_metrics(event_zscores, sample_rate=60, threshold=1.0, pre=0):
+    """
+    Objective: To find the event_metrics of the mean zscore of all events.
+    With pre=0 'peak' and 'time_to_peak' are what zscore_max gives.
+
+    Returns
+    -------
+    metrics: dict
+        This dict holds a float for each of the event_metrics.
+    """
+    trace = _column_means(pad_windows(event_zscores))
+    metrics = event_metrics(trace[None, :], sample_rate, threshold, pre)
+    return {key: float(value[0]) for key, value in metrics.items()}
 
-    behav_start_loc = behavior_nearest_loc(fluor_array, behav_start_array)
-    # print(behav_start_loc)
-    behav_start_value = behavior_nearest_value(fluor_array, behav_start_array)
-    # print(behav_start_value)
 
-    behav_stop_loc = behavior_nearest_loc(fluor_array, behav_stop_array)
-    # print(behav_stop_loc)
-    behav_stop_value = behavior_nearest_value(fluor_array, behav_stop_array)
-    # print(behav_stop_value)
+@memo.memoize
+def behavior_statistics(fluor_array, behav_start_array, behav_stop_array,
+                        normsig, timeafter=300, timeprior=300,
+                        sample_rate=60, alignment=None):
+    """
+    Objective: To find the auc, max zscore and location of the max zscore
+    for one behavior from arrays already in memory.
+
+    Parameters
+    ----------
+    fluor_array: list
+        This numpy array contains of all the time points corresponding
+        to the green channel.
+
+    behav_start_array: list
+        This numpy array contains the start times of the behavior.
+
+    behav_stop_array: list
+        This numpy array contains the stop times of the behavior.
+
+    normsig: list
+        This numpy array contains the normalized
+        fluroescent values for the green channel.
+
+    timeafter: int
+        The number of samples after the start of each event to zscore.
+
+    timeprior: int
+        The number of samples in the baseline before each event.
 
-    auc = area_under_curve(behav_start_loc, behav_stop_loc, sages2ndFit)
+    sample_rate: float
+        The samples per second of the signal. Timebase(fluor_array) gives
+        the measured rate and turns seconds into sample counts.
 
-    behavior_fluorescence = behavior_fluor(behav_start_loc, 300,
-                                           sages2ndFit)
+    alignment: dict
+        The align_events result for the behavior, if it has already been
+        found, for example by align_behaviors for the whole session.
 
-    baseline_fluorescence = baseline_fluor(behav_start_loc, behav_stop_loc,
-                                           sages2ndFit, 300)
+
+    Returns
+    -------
+    result: dict
+        This dict holds the number of events 'n_events', the 'auc', the
+        'max_zscore' and its location in seconds 'idx_sec', and the
+        trace_metrics ('trace') and event_metrics ('events') of the
+        zscores.
+    """
+    if alignment is None:
+        # one search for the starts and stops together
+        alignment = align_events(fluor_array, behav_start_array,
+                                 behav_stop_array)
+    behav_start_loc = alignment['start_loc']
+    behav_stop_loc = alignment['stop_loc']
+
+    auc = area_under_curve(behav_start_loc, behav_stop_loc, normsig)
+
+    # the same windows as behavior_fluor and baseline_fluor, as arrays
+    behavior_fluorescence, _ = epochs(normsig, behav_start_loc,
+                                      0, timeafter)
+
+    baseline_fluorescence, _ = window_matrix(
+        normsig, np.asarray(behav_stop_loc) - timeprior, behav_start_loc)
 
     baseline_mean = base_mean(baseline_fluorescence)
 
@@ -360,15 +1036,85 @@ def statistics(fTimeGreen_path, behav_start_time_path, behav_stop_time_path, nor
 
     zscore = event_z(behavior_fluorescence, baseline_mean, baseline_stdev)
 
-    max_zscore, idx_sec = zscore_max(zscore)
+    max_zscore, idx_sec = zscore_max(zscore, sample_rate)
+    return {'n_events': len(behav_start_loc), 'auc': auc,
+            'max_zscore': max_zscore, 'idx_sec': idx_sec,
+            'trace': trace_metrics(zscore, sample_rate),
+            'events': event_metrics(zscore, sample_rate)}
+
+
+def statistics(fTimeGreen_path, behav_start_time_path, behav_stop_time_path, normsig_path, label=None,
+               timeafter=300, timeprior=300, sample_rate=None, sink=None,
+               event_sink=None):
+    """
+    Objective: To find the auc, max zscore and location of the max zscore
+    for one behavior. The files are read on every call; to analyse many
+    behaviors load them once and use behavior_statistics, or
+    pipeline.session_statistics.
+
+    Parameters
+    ----------
+    fTimeGreen_path: str
+        The file path of the green channel time points, or the array.
+
+    behav_start_time_path: str
+        The file path of the behavior start times, or the array.
 
-    # auc, z-score max value, and zscore max value location appended here
-    results_file = open("results.csv", 'a')
-    results_file.write(f"behavior:{behav_start_time_path}, auc:{auc}, zscore:{max_zscore}, max zscore location{idx_sec}\n")
+    behav_stop_time_path: str
+        The file path of the behavior stop times, or the array.
+
+    normsig_path: str
+        The file path of the normalized signal, or the array.
+
+    label: str
+        The behavior name written to sink.
+        Defaults to behav_start_time_path.
+
+    timeafter: int
+        The number of samples after the start of each event to zscore.
+
+    timeprior: int
+        The number of samples in the baseline before each event.
+
+    sample_rate: float
+        The samples per second of the signal. Defaults to the rate
+        Timebase measures from the green channel time points, so the
+        latencies written to sink are in seconds.
+
+    sink: ResultsWriter
+        If given, a results.SUMMARY_COLUMNS row is added to it.
+
+    event_sink: ResultsWriter
+        If given, a results.EVENT_COLUMNS row for each event is added.
+
+
+    Returns
+    -------
+    result: dict
+        The behavior_statistics result.
+    """
+    fluor_array = file2numpy(fTimeGreen_path)
+    if sample_rate is None:
+        sample_rate = timebase.Timebase(fluor_array).sample_rate
+    result = behavior_statistics(fluor_array,
+                                 file2numpy(behav_start_time_path),
+                                 file2numpy(behav_stop_time_path),
+                                 file2numpy(normsig_path),
+                                 timeafter, timeprior, sample_rate)
+
+    # auc, z-score max value, and zscore max value location added here
+    if label is None:
+        label = behav_start_time_path
+    if sink is not None:
+        sink.append(results.summary_row(result, label))
+    if event_sink is not None:
+        event_sink.extend(**results.event_rows(result, label))
+    return result
 
 
 def main():
-    statistics("/home/jovyan/swefs_group1/correct_func_test_data/fTimeGreen.txt", "/home/jovyan/swefs_group1/correct_func_test_data/push_start_time.txt", "/home/jovyan/swefs_group1/correct_func_test_data/push_stop_time.txt", "/home/jovyan/swefs_group1/correct_func_test_data/sages2ndFit1.txt")
+    with results.ResultsWriter("results.csv") as sink:
+        statistics("/home/jovyan/swefs_group1/correct_func_test_data/fTimeGreen.txt", "/home/jovyan/swefs_group1/correct_func_test_data/push_start_time.txt", "/home/jovyan/swefs_group1/correct_func_test_data/push_stop_time.txt", "/home/jovyan/swefs_group1/correct_func_test_data/sages2ndFit1.txt", sink=sink)
 
 
 if __name__ == "__main__":
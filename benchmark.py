@@ -0,0 +1,297 @@
+#!/usr/bin/python3
+"""
+Benchmarks for the parsing and analysis code, run on the files bundled
+in correct_func_test_data. Run all of them with
+
+    python benchmark.py
+
+or only some of them with
+
+    python benchmark.py readers
+"""
+
+import os
+import sys
+import time
+import tempfile
+import multiprocessing
+import numpy as np
+import readers
+import follow
+import parsing
+import ingest
+import allfunctions
+import boris
+import resampling
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'correct_func_test_data')
+
+
+def synthetic_data(rows, seed=0):
+    """
+    Objective: To make the rows of a raw data file shaped like a
+    FiberPhoSig recording (timestamps 25 ms apart with a little jitter,
+    LED flags and four fluorescence columns), since none is bundled
+    with the repo.
+
+    Parameters
+    ----------
+    rows: int
+        The number of rows to make.
+
+    seed: int
+        The seed for the jitter and the random fluorescence values.
+
+
+    Returns
+    -------
+    data: array
+        This (rows x 6) array holds the rows.
+    """
+    rng = np.random.default_rng(seed)
+    ftime = 32468000 + 25.0 * np.arange(rows) + rng.normal(0, 0.5, rows)
+    flags = np.array([20, 17, 18])[np.arange(rows) % 3]
+    return np.column_stack([ftime, flags, rng.random((rows, 4))])
+
+
+def write_raw(path, data):
+    """
+    Objective: To write rows from synthetic_data as a raw data file.
+    """
+    np.savetxt(path, data, fmt=['%.2f', '%d'] + ['%.6f'] * 4)
+
+
+def synthetic_raw(path, rows, seed=0):
+    """
+    Objective: To write a raw data file of synthetic_data rows.
+
+    Parameters
+    ----------
+    path: string
+        The file path to write.
+
+    rows: int
+        The number of rows to write.
+
+    seed: int
+        The seed for the random fluorescence values.
+    """
+    write_raw(path, synthetic_data(rows, seed))
+
+
+def best_time(function, *args, repeat=5, **kwargs):
+    """
+    Objective: To time a function call.
+
+    Parameters
+    ----------
+    function: function
+        The function to time.
+
+    repeat: int
+        The number of times to call the function.
+
+
+    Returns
+    -------
+    seconds: float
+        The fastest of the calls in seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench_readers():
+    """
+    Objective: To compare the readers.BACKENDS on the
+    bundled text files against plain np.loadtxt.
+    """
+    for name in ('fTimeGreen.txt', 'sages2ndFit1.txt'):
+        path = os.path.join(DATA_DIR, name)
+        expected = np.loadtxt(path, dtype=float)
+        baseline = best_time(np.loadtxt, path, dtype=float)
+        print(f"{name} ({len(expected)} rows)")
+        print(f"  {'np.loadtxt':<10} {baseline*1000:8.2f} ms")
+        for backend in readers.BACKENDS:
+            array = readers.read_array(path, backend)
+            assert array.dtype == expected.dtype
+            assert np.array_equal(array, expected)
+            seconds = best_time(readers.read_array, path, backend)
+            print(f"  {backend:<10} {seconds*1000:8.2f} ms "
+                  f"({baseline/seconds:.2f}x)")
+
+
+def bench_follow(rows=12000, speed=20.0):
+    """
+    Objective: To replay a recording at speed times real time from
+    another process and measure how long rows take to reach the
+    FollowReader channel buffers.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, 'recording.csv')
+        live = os.path.join(directory, 'live.csv')
+        synthetic_raw(source, rows)
+        ftime = np.loadtxt(source)[:, 0]
+
+        start_time = time.time() + 0.5
+        writer = multiprocessing.Process(target=follow.replay,
+                                         args=(source, live, speed,
+                                               start_time))
+        writer.start()
+        reader = follow.FollowReader(live, poll_interval=0.01)
+        lags = []
+
+        def record_lag():
+            # lag of the newest row from when the writer was due to write it
+            if reader.rows:
+                row_time = ftime[reader.rows - 1] - ftime[0]
+                due = start_time + row_time / 1000 / speed
+                lags.append(time.time() - due)
+            return not writer.is_alive() and reader.rows == rows
+
+        reader.follow(idle_timeout=5, stop=record_lag)
+        writer.join()
+        session = reader.session()
+        expected = parsing.file_reader(source, use_cache=False)
+        for name in parsing.CHANNEL_NAMES:
+            count = len(expected[name])
+            assert np.array_equal(session[name][:count], expected[name])
+
+    lags = np.array(lags)
+    print(f"{rows} rows replayed at {speed:g}x in "
+          f"{rows * 25 / 1000 / speed:.1f} s, {len(reader.latencies)} polls")
+    print(f"  lag behind writer: median {np.median(lags)*1000:.1f} ms, "
+          f"max {lags.max()*1000:.1f} ms")
+
+
+def bench_ingest(files=8, rows=200000):
+    """
+    Objective: To time ingest.ingest on a directory of synthetic
+    recordings with one worker and with one worker per CPU.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        for number in range(files):
+            synthetic_raw(os.path.join(directory,
+                                       f"FiberPhoSig{number:03d}.csv"),
+                          rows, seed=number)
+        cpus = os.cpu_count() or 1
+        timings = {}
+        for processes in sorted({1, cpus}):
+            seconds = best_time(ingest.ingest, directory, processes,
+                                progress=False, use_cache=False, repeat=1)
+            timings[processes] = seconds
+            print(f"  {processes:3d} processes: {seconds:.2f} s "
+                  f"({files/seconds:.1f} files/s, "
+                  f"{timings[1]/seconds:.2f}x)")
+
+
+def argmin_nearest_loc(fluor_array, behav_array):
+    """
+    Objective: The original behavior_nearest_loc loop,
+    kept to time nearest_index against.
+    """
+    near_loc = []
+    for x in np.nditer(behav_array):
+        loc = (np.abs(fluor_array - x)).argmin()
+        near_loc.append(loc)
+    return near_loc
+
+
+def legacy_nearest_value(fluor_array, behav_array):
+    """
+    Objective: The original behavior_nearest_value loop,
+    kept to time align_events against.
+    """
+    near_value = []
+    for x in behav_array:
+        n = [abs(i - x) for i in fluor_array]
+        value = n.index(min(n))
+        near_value.append(fluor_array[value])
+    return near_value
+
+
+def bench_align(events=5000):
+    """
+    Objective: To time nearest_index and align_events against the
+    original loops. test_allfunctions checks they give the same results.
+    """
+    fluor_array = allfunctions.file2numpy(os.path.join(DATA_DIR,
+                                                       'fTimeGreen.txt'))
+    rng = np.random.default_rng(0)
+    behav_array = rng.uniform(fluor_array[0] - 1000, fluor_array[-1] + 1000,
+                              events)
+    loop = best_time(argmin_nearest_loc, fluor_array, behav_array, repeat=1)
+    search = best_time(allfunctions.nearest_index, fluor_array, behav_array)
+    print(f"  {events} events: argmin loop {loop*1000:.1f} ms, "
+          f"nearest_index {search*1000:.3f} ms ({loop/search:.0f}x)")
+
+    # the four searches statistics used to make for one behavior
+    starts = allfunctions.file2numpy(os.path.join(DATA_DIR,
+                                                  'push_start_time.txt'))
+    stops = allfunctions.file2numpy(os.path.join(DATA_DIR,
+                                                 'push_stop_time.txt'))
+    four = best_time(lambda: (argmin_nearest_loc(fluor_array, starts),
+                              legacy_nearest_value(fluor_array, starts),
+                              argmin_nearest_loc(fluor_array, stops),
+                              legacy_nearest_value(fluor_array, stops)),
+                     repeat=1)
+    fused = best_time(allfunctions.align_events, fluor_array, starts, stops)
+    print(f"  push starts and stops: four searches {four*1000:.1f} ms, "
+          f"align_events {fused*1000:.3f} ms")
+
+
+def bench_resampling(n_resamples=10000):
+    """
+    Objective: To check the observed auc and peak zscore of
+    resampling.permutation_test against allfunctions and to time
+    n_resamples permutations of each behavior in correct_test_data.
+    """
+    fluor_array = allfunctions.file2numpy(os.path.join(DATA_DIR,
+                                                       'fTimeGreen.txt'))
+    normsig = allfunctions.file2numpy(os.path.join(DATA_DIR,
+                                                   'sages2ndFit1.txt'))
+    boris_dir = os.path.join(os.path.dirname(DATA_DIR), 'correct_test_data')
+    events = boris.load_boris(sorted(
+        os.path.join(boris_dir, name) for name in os.listdir(boris_dir)))
+    alignments = allfunctions.align_behaviors(fluor_array, events)
+    for behavior, alignment in alignments.items():
+        start, stop = alignment['start_loc'], alignment['stop_loc']
+        if len(start) < 2:
+            continue
+        epoch_fluor, _ = allfunctions.epochs(normsig, start, 0, 300)
+        baseline, _ = allfunctions.window_matrix(normsig, stop - 300, start)
+        zscore = allfunctions.event_z(epoch_fluor,
+                                      allfunctions.base_mean(baseline),
+                                      allfunctions.baselinestd(baseline))
+        seconds = best_time(resampling.permutation_test, start, stop,
+                            normsig, n_resamples, seed=0, repeat=1)
+        result = resampling.permutation_test(start, stop, normsig, 100,
+                                             seed=0)
+        assert np.isclose(result['auc'], allfunctions.area_under_curve(
+            start, stop, normsig))
+        assert np.isclose(result['peak_z'],
+                          allfunctions.zscore_max(zscore)[0])
+        print(f"  {behavior:<13} {len(start):3d} events: {n_resamples} "
+              f"permutations {seconds:.2f} s")
+
+
+BENCHMARKS = {'readers': bench_readers, 'follow': bench_follow,
+              'ingest': bench_ingest, 'align': bench_align,
+              'resampling': bench_resampling}
+
+
+def main():
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print(f"== {name} ==")
+        BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/python3
+"""
+Contains the function load_boris which reads one or many BORIS
+behavior exports (like the files in correct_test_data) and groups the
+events by behavior, so the start and stop times of every behavior can
+be handed to allfunctions without writing per-behavior text files.
+"""
+
+import csv
+import configparser
+import numpy as np
+
+
+# BORIS export columns read by load_boris
+BEHAVIOR_COLUMN = 'Behavior'
+START_COLUMN = 'start TOD'
+STOP_COLUMN = 'stop TOD'
+
+
+class BehaviorEvents:
+    """
+    Holds the events of every behavior as two concatenated arrays. The
+    events of behaviors[i] are start[offsets[i]:offsets[i+1]] and
+    stop[offsets[i]:offsets[i+1]], sorted by start time.
+
+    Parameters
+    ----------
+    behaviors: tuple
+        The behavior names, sorted.
+
+    offsets: array
+        This array holds where the events of each behavior
+        begin, followed by the total number of events.
+
+    start: array
+        This array holds the start times of all events.
+
+    stop: array
+        This array holds the stop times of all events.
+    """
+    __slots__ = ('behaviors', 'offsets', 'start', 'stop')
+
+    def __init__(self, behaviors, offsets, start, stop):
+        self.behaviors = tuple(behaviors)
+        self.offsets = offsets
+        self.start = start
+        self.stop = stop
+
+    def _slice(self, behavior):
+        i = self.behaviors.index(behavior)
+        return slice(self.offsets[i], self.offsets[i+1])
+
+    def start_times(self, behavior):
+        """
+        Objective: To give the start times of one behavior.
+        """
+        return self.start[self._slice(behavior)]
+
+    def stop_times(self, behavior):
+        """
+        Objective: To give the stop times of one behavior.
+        """
+        return self.stop[self._slice(behavior)]
+
+    def __getitem__(self, behavior):
+        if behavior not in self.behaviors:
+            raise KeyError(behavior)
+        where = self._slice(behavior)
+        return self.start[where], self.stop[where]
+
+    def __contains__(self, behavior):
+        return behavior in self.behaviors
+
+    def __iter__(self):
+        return iter(self.behaviors)
+
+    def __len__(self):
+        return len(self.behaviors)
+
+    def items(self):
+        return [(behavior, self[behavior]) for behavior in self.behaviors]
+
+    def __repr__(self):
+        return (f"BehaviorEvents({len(self.behaviors)} behaviors, "
+                f"{len(self.start)} events)")
+
+
+def behaviors_from_config(config_path):
+    """
+    Objective: To list the behaviors switched on in the
+    [BEHAVIORS] section of a config file.
+
+    Parameters
+    ----------
+    config_path: string
+        This will provide the file path to the config.ini file.
+
+
+    Returns
+    -------
+    behaviors: list
+        The names of the behaviors set to True.
+    """
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    section = config['BEHAVIORS']
+    return [behavior for behavior in section if section.getboolean(behavior)]
+
+
+def load_boris(paths, start_column=START_COLUMN, stop_column=STOP_COLUMN):
+    """
+    Objective: To read BORIS exports and group their events by behavior.
+
+    Parameters
+    ----------
+    paths: string or list
+        The file path of one BORIS export, or a list of them.
+
+    start_column: string
+        The column with the event start times. The default, 'start TOD',
+        is on the same clock as the fluorescence timestamps.
+
+    stop_column: string
+        The column with the event stop times.
+
+
+    Returns
+    -------
+    events: BehaviorEvents
+        The events of every behavior found in the files.
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    names, start, stop = [], [], []
+    for path in paths:
+        with open(path, newline='', encoding='utf-8-sig') as opened_file:
+            reader = csv.reader(opened_file)
+            header = next(reader, None)
+            if header is None:
+                continue
+            columns = [header.index(column) for column in
+                       (BEHAVIOR_COLUMN, start_column, stop_column)]
+            rows = [[row[i] for i in columns] for row in reader if row]
+        if rows:
+            file_names, file_start, file_stop = zip(*rows)
+            names.extend(file_names)
+            start.extend(file_start)
+            stop.extend(file_stop)
+
+    start = np.array(start, dtype=float)
+    stop = np.array(stop, dtype=float)
+    behaviors, codes = np.unique(np.array(names, dtype=str),
+                                 return_inverse=True)
+    # sort by behavior, then by start time within each behavior
+    order = np.lexsort((start, codes))
+    counts = np.bincount(codes, minlength=len(behaviors))
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    return BehaviorEvents(behaviors.tolist(), offsets,
+                          start[order], stop[order])
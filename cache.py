@@ -0,0 +1,279 @@
+#!/usr/bin/python3
+"""
+Contains the functions for the on-disk cache of parsed raw data files.
+The deinterleaved arrays from parsing.file_reader are written as .npy
+files to a cache directory next to the raw data file, and later reads
+memory-map them instead of parsing the text again.
+
+Each cache entry is keyed by the path, size, modification time and
+content hash of the raw data file plus the channel start rows, so an
+entry is never used after the raw file or the config changes. The
+sparse time index used by file_reader for time ranges is kept in the
+same cache, keyed without the content hash so it can be checked
+without reading the file.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+
+
+# name of the cache directory created next to the raw data file
+CACHE_DIRNAME = '.fiberpho_cache'
+
+# the oldest entries are removed once the cache is bigger than this
+MAX_CACHE_BYTES = 2 * 1024**3
+
+# once the cache is too big, entries are removed until it is down to
+# this fraction of the largest size, so it is not listed on every store
+EVICT_FRACTION = 0.9
+
+# bytes read at a time when hashing the raw data file
+HASH_BLOCKSIZE = 1024**2
+
+# the size of each cache directory, counted when it is first stored to
+# and kept up to date by store; entries written by other processes are
+# only counted when the directory is next listed by evict
+_sizes = {}
+
+
+def default_cache_dir(filename):
+    """
+    Objective: To give the cache directory used for a raw data file.
+
+    Parameters
+    ----------
+    filename: string
+        This will provide the file path needed to the raw data file.
+
+
+    Returns
+    -------
+    cache_dir: string
+        The path of the cache directory next to the raw data file.
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    return os.path.join(directory, CACHE_DIRNAME)
+
+
+def fingerprint(filename, content_hash=True):
+    """
+    Objective: To describe the raw data file so a change
+    to it can be detected.
+
+    Parameters
+    ----------
+    filename: string
+        This will provide the file path needed to the raw data file.
+
+    content_hash: bool
+        If False, the file is not read and only its
+        path, size and modification time are used.
+
+
+    Returns
+    -------
+    fingerprint: dict
+        This dict holds the absolute path, size, modification
+        time and content hash of the file.
+    """
+    stat = os.stat(filename)
+    info = {'path': os.path.abspath(filename),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns}
+    if content_hash:
+        digest = hashlib.sha1()
+        with open(filename, 'rb') as opened_file:
+            for block in iter(lambda: opened_file.read(HASH_BLOCKSIZE), b''):
+                digest.update(block)
+        info['sha1'] = digest.hexdigest()
+    return info
+
+
+def cache_key(filename, params, kind='parsed', content_hash=True):
+    """
+    Objective: To build the name of the cache entry for a raw data file.
+
+    Parameters
+    ----------
+    filename: string
+        This will provide the file path needed to the raw data file.
+
+    params: dict
+        The parsing parameters (such as the start rows)
+        that change the parsed arrays.
+
+    kind: string
+        What the entry holds, so different kinds of entry
+        for the same file do not replace each other.
+
+    content_hash: bool
+        If False, the file contents are not hashed, see fingerprint.
+
+
+    Returns
+    -------
+    key: string
+        The entry name. It starts with the kind and hashes of the path
+        and of params, so older entries for the same file and params
+        can be found and removed, while entries for other params stay.
+    """
+    info = fingerprint(filename, content_hash)
+    path_hash = hashlib.sha1(info['path'].encode()).hexdigest()[:16]
+    params = json.dumps(params, sort_keys=True).encode()
+    params_hash = hashlib.sha1(params).hexdigest()[:16]
+    content = json.dumps(info, sort_keys=True).encode()
+    info_hash = hashlib.sha1(content).hexdigest()[:16]
+    return f"{kind}-{path_hash}-{params_hash}-{info_hash}"
+
+
+def load(cache_dir, key):
+    """
+    Objective: To memory-map the arrays of a cache entry.
+
+    Parameters
+    ----------
+    cache_dir: string
+        The path of the cache directory.
+
+    key: string
+        The entry name from cache_key.
+
+
+    Returns
+    -------
+    arrays: dict
+        This dict holds a read-only memory-mapped array for each
+        name stored, or is None if the entry does not exist.
+    """
+    entry = os.path.join(cache_dir, key)
+    try:
+        with open(os.path.join(entry, 'names.json')) as opened_file:
+            names = json.load(opened_file)
+        arrays = {name: np.load(os.path.join(entry, name + '.npy'),
+                                mmap_mode='r')
+                  for name in names}
+    except (OSError, ValueError):
+        return None
+    # the entry modification time records when it was last used
+    try:
+        os.utime(entry)
+    except OSError:
+        # a read-only cache can still be read
+        pass
+    return arrays
+
+
+def store(cache_dir, key, arrays, max_bytes=MAX_CACHE_BYTES):
+    """
+    Objective: To write the arrays of a cache entry, remove older entries
+    for the same file and params and keep the cache directory under
+    max_bytes.
+
+    Parameters
+    ----------
+    cache_dir: string
+        The path of the cache directory.
+
+    key: string
+        The entry name from cache_key.
+
+    arrays: dict
+        This dict holds the arrays to store.
+
+    max_bytes: int
+        The largest size the cache directory may grow to.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    entry = os.path.join(cache_dir, key)
+    # write to a temporary directory first so a half written
+    # entry is never read
+    tmp_entry = tempfile.mkdtemp(prefix='.tmp-', dir=cache_dir)
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_entry, name + '.npy'), array)
+        with open(os.path.join(tmp_entry, 'names.json'), 'w') as opened_file:
+            json.dump(list(arrays), opened_file)
+        os.rename(tmp_entry, entry)
+    except OSError:
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        if not os.path.isdir(entry):
+            raise
+    size = _entry_size(entry)
+
+    if '-' in key:
+        prefix = key.rsplit('-', 1)[0] + '-'
+        for name in os.listdir(cache_dir):
+            if name.startswith(prefix) and name != key:
+                old_entry = os.path.join(cache_dir, name)
+                size -= _entry_size(old_entry)
+                shutil.rmtree(old_entry, ignore_errors=True)
+
+    # the directory is only listed the first time and once it is too big
+    directory = os.path.abspath(cache_dir)
+    total = _sizes.get(directory)
+    if total is None or total + size > max_bytes:
+        total = evict(cache_dir, max_bytes, int(max_bytes * EVICT_FRACTION))
+    else:
+        total += size
+    _sizes[directory] = total
+
+
+def _entry_size(entry):
+    """
+    Objective: To give the bytes in the files of a cache entry.
+    """
+    try:
+        return sum(os.path.getsize(os.path.join(entry, name))
+                   for name in os.listdir(entry))
+    except OSError:
+        return 0
+
+
+def evict(cache_dir, max_bytes=MAX_CACHE_BYTES, target_bytes=None):
+    """
+    Objective: To remove the least recently used cache entries if
+    the cache directory is bigger than max_bytes.
+
+    Parameters
+    ----------
+    cache_dir: string
+        The path of the cache directory.
+
+    max_bytes: int
+        The largest size the cache directory may grow to.
+
+    target_bytes: int
+        The size entries are removed down to. Defaults to max_bytes.
+
+
+    Returns
+    -------
+    total: int
+        The bytes left in the cache directory.
+    """
+    if target_bytes is None:
+        target_bytes = max_bytes
+    entries = []
+    for name in os.listdir(cache_dir):
+        entry = os.path.join(cache_dir, name)
+        if name.startswith('.') or not os.path.isdir(entry):
+            continue
+        try:
+            entries.append((os.path.getmtime(entry), _entry_size(entry),
+                            entry))
+        except OSError:
+            # removed by another process
+            continue
+    total = sum(size for _, size, _ in entries)
+    if total <= max_bytes:
+        return total
+    for _, size, entry in sorted(entries):
+        if total <= target_bytes:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+    return total
@@ -0,0 +1,340 @@
+#!/usr/bin/python3
+"""
+Contains the function run_cohort, which analyses every session, animal
+and behavior of a cohort across a pool of processes.
+
+The sessions are listed in a CSV table with a 'raw' column (the
+FiberPhoSig file) and a 'boris' column (the BORIS exports of the
+session, separated by ';'). Optional columns are 'session' (the name
+used in the results), 'animals' (roles from the [ANIMALS] config
+section, separated by ';'), 'fluor_array' (a file to use instead of
+the time points of the raw file) and 'normsig' (a file to use instead
+of normalizing the subject's signal). The normalized signal of another
+role is given in a column named after it, such as 'normsig_partner';
+roles without one are normalized from the raw file. Relative paths are
+taken from the table's directory.
+
+Each session and animal is one job, which loads the session once with
+pipeline.load_session and then analyses each behavior on its own,
+writing its results to a part file of its own only if it succeeds.
+Every behavior is recorded in a JSON lines manifest as 'done',
+'failed' or 'missing' (not in the session's BORIS exports), so a run
+that was stopped, or that failed on some behaviors, redoes only those.
+A missing behavior is not looked for again; remove its manifest lines
+after adding a BORIS export. A session whose BORIS exports cannot be
+read is recorded as failed with no behavior.
+At the end the part files of the behaviors the manifest records as
+done are merged into one results table. Run it from the command line
+with
+
+    python cohort.py <sessions.csv> [config.ini] [processes] [results.csv]
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import hashlib
+import configparser
+import traceback
+import concurrent.futures
+import boris
+import pipeline
+import results
+
+
+# the roles analysed when neither the table nor a config names them
+DEFAULT_ANIMALS = ('subject',)
+
+
+def animals_from_config(config_path):
+    """
+    Objective: To list the animal roles switched on in the
+    [ANIMALS] section of a config file.
+    """
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    section = config['ANIMALS']
+    return [animal for animal in section if section.getboolean(animal)]
+
+
+def read_sessions(table_path):
+    """
+    Objective: To read the sessions table.
+
+    Parameters
+    ----------
+    table_path: string
+        The file path of the sessions CSV table.
+
+
+    Returns
+    -------
+    sessions: list
+        One dict per row holding the 'session' name, the 'raw' path, the
+        list of 'boris' paths, the list of 'animals' (empty to use the
+        default), the 'fluor_array' path (or None) and a dict of the
+        'normsig' path of each animal that has one.
+    """
+    directory = os.path.dirname(os.path.abspath(table_path))
+
+    def resolve(path):
+        return os.path.join(directory, path.strip()) if path.strip() else None
+
+    sessions = []
+    with open(table_path, newline='', encoding='utf-8-sig') as opened_file:
+        for row in csv.DictReader(opened_file):
+            raw = resolve(row.get('raw') or '')
+            normsig = {'subject': resolve(row.get('normsig') or '')}
+            for column, path in row.items():
+                if column and column.startswith('normsig_'):
+                    normsig[column[len('normsig_'):]] = resolve(path or '')
+            sessions.append({
+                'session': (row.get('session') or '').strip() or
+                           os.path.splitext(os.path.basename(raw or ''))[0],
+                'raw': raw,
+                'boris': [resolve(path) for path in
+                          (row.get('boris') or '').split(';') if path.strip()],
+                'animals': [animal.strip() for animal in
+                            (row.get('animals') or '').split(';')
+                            if animal.strip()],
+                'fluor_array': resolve(row.get('fluor_array') or ''),
+                'normsig': {animal: path for animal, path in normsig.items()
+                            if path}})
+    return sessions
+
+
+def read_manifest(manifest_path, statuses=('done',)):
+    """
+    Objective: To find the jobs a manifest records with one of statuses.
+
+    Returns
+    -------
+    done: set
+        The (session, animal, behavior) of every such behavior.
+    """
+    done = set()
+    if not os.path.exists(manifest_path):
+        return done
+    with open(manifest_path) as opened_file:
+        for line in opened_file:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # a line cut off when a run was stopped
+                continue
+            if entry.get('status') in statuses:
+                done.add((entry['session'], entry['animal'],
+                          entry['behavior']))
+    return done
+
+
+def part_paths(parts_dir, session, animal, behavior, extension='.csv'):
+    """
+    Objective: To give the summary and event part files of one session,
+    animal and behavior. The name holds a hash of the behavior, so any
+    behavior name makes a valid file name and running the same behavior
+    again writes over its own part files.
+    """
+    digest = hashlib.sha1(behavior.encode()).hexdigest()
+    root = os.path.join(parts_dir, f"{session}.{animal}.{digest[:12]}")
+    return root + extension, root + '.events' + extension
+
+
+def _run_job(job, parts_dir, extension, stats_kwargs):
+    """
+    Objective: To analyse each behavior of one session and animal in a
+    worker process and write the results of those that finished to
+    their part files.
+
+    Returns
+    -------
+    outcomes: list
+        One dict per behavior, holding the 'session', 'animal',
+        'behavior', its 'status', the 'error' (None if it finished)
+        and the 'seconds' it took.
+    """
+    started = time.perf_counter()
+    outcomes = [{'session': job['session'], 'animal': job['animal'],
+                 'behavior': behavior, 'status': 'done', 'error': None}
+                for behavior in job['behaviors']]
+    try:
+        session = pipeline.load_session(job['raw'], job['boris'],
+                                        job['animal'],
+                                        fluor_array=job['fluor_array'],
+                                        normsig=job['normsig'])
+    except Exception:
+        error = traceback.format_exc()
+        seconds = time.perf_counter() - started
+        for outcome in outcomes:
+            outcome.update(status='failed', error=error, seconds=seconds)
+        return outcomes
+    session['session'] = job['session']
+
+    for outcome in outcomes:
+        started = time.perf_counter()
+        behavior = outcome['behavior']
+        if behavior not in session['events']:
+            outcome.update(status='missing',
+                           error=f"{behavior} is not in the BORIS exports "
+                                 f"of {job['session']}")
+        else:
+            summary_path, event_path = part_paths(
+                parts_dir, job['session'], job['animal'], behavior,
+                extension)
+            try:
+                # a behavior that raises writes no part files
+                with results.ResultsWriter(summary_path) as sink, \
+                        results.ResultsWriter(
+                            event_path, results.EVENT_COLUMNS) as event_sink:
+                    pipeline.session_statistics(session, [behavior],
+                                                sink=sink,
+                                                event_sink=event_sink,
+                                                **stats_kwargs)
+            except Exception:
+                outcome.update(status='failed',
+                               error=traceback.format_exc())
+        outcome['seconds'] = time.perf_counter() - started
+    return outcomes
+
+
+def run_cohort(table_path, config_path=None, processes=None,
+               results_path='cohort_results.csv', behaviors=None,
+               animals=None, progress=True, **stats_kwargs):
+    """
+    Objective: To analyse every session, animal and behavior of a cohort
+    in parallel, skipping those a previous run finished.
+
+    Parameters
+    ----------
+    table_path: string
+        The file path of the sessions CSV table.
+
+    config_path: string
+        A config.ini file whose [BEHAVIORS] and [ANIMALS] sections
+        choose the behaviors and animals.
+
+    processes: int
+        The number of worker processes. Defaults to the number of CPUs.
+
+    results_path: string
+        The merged results table. The events table, manifest and part
+        files are kept next to it.
+
+    behaviors: list
+        The behaviors to analyse, instead of those in the config.
+        Defaults to every behavior in each session's BORIS exports.
+
+    animals: list
+        The animal roles to analyse for sessions that do not name their
+        own, instead of those in the config.
+
+    progress: bool
+        If True, print the progress and throughput to stderr.
+
+    stats_kwargs:
+        Passed on to pipeline.session_statistics.
+
+
+    Returns
+    -------
+    outcomes: list
+        One dict per behavior run, holding the 'session', 'animal',
+        'behavior' (None for a session whose BORIS exports could not be
+        read), its 'status' ('done', 'failed' or 'missing'), the
+        'error' (None if it finished) and the 'seconds' it took.
+    """
+    root, extension = os.path.splitext(results_path)
+    parts_dir = root + '.parts'
+    manifest_path = root + '.manifest.jsonl'
+    os.makedirs(parts_dir, exist_ok=True)
+    if config_path is not None:
+        if behaviors is None:
+            behaviors = boris.behaviors_from_config(config_path)
+        if animals is None:
+            animals = animals_from_config(config_path)
+    animals = animals or DEFAULT_ANIMALS
+
+    # behaviors missing from a session are not looked for again
+    finished = read_manifest(manifest_path, ('done', 'missing'))
+    jobs = []
+    outcomes = []
+    for session in read_sessions(table_path):
+        wanted = behaviors
+        if wanted is None:
+            started = time.perf_counter()
+            try:
+                wanted = boris.load_boris(session['boris']).behaviors
+            except Exception:
+                outcomes.extend(
+                    {'session': session['session'], 'animal': animal,
+                     'behavior': None, 'status': 'failed',
+                     'error': traceback.format_exc(),
+                     'seconds': time.perf_counter() - started}
+                    for animal in session['animals'] or animals)
+                continue
+        for animal in session['animals'] or animals:
+            todo = [behavior for behavior in wanted
+                    if (session['session'], animal, behavior) not in finished]
+            if todo:
+                jobs.append({**session, 'animal': animal, 'behaviors': todo,
+                             'normsig': session['normsig'].get(animal)})
+
+    started = time.perf_counter()
+    sessions_done = set()
+    with open(manifest_path, 'a') as manifest, \
+            concurrent.futures.ProcessPoolExecutor(processes) as executor:
+        for outcome in outcomes:
+            manifest.write(json.dumps(outcome) + '\n')
+        futures = [executor.submit(_run_job, job, parts_dir, extension,
+                                   stats_kwargs) for job in jobs]
+        for count, future in enumerate(
+                concurrent.futures.as_completed(futures), 1):
+            job_outcomes = future.result()
+            outcomes.extend(job_outcomes)
+            for outcome in job_outcomes:
+                manifest.write(json.dumps(outcome) + '\n')
+            manifest.flush()
+            os.fsync(manifest.fileno())
+            job = job_outcomes[0]
+            sessions_done.add(job['session'])
+            if progress:
+                minutes = (time.perf_counter() - started) / 60
+                done = sum(outcome['status'] == 'done'
+                           for outcome in job_outcomes)
+                print(f"[{count}/{len(jobs)}] {job['session']} "
+                      f"{job['animal']}: {done} of {len(job_outcomes)} "
+                      f"behaviors done "
+                      f"({len(sessions_done)/minutes:.1f} sessions/min)",
+                      file=sys.stderr)
+
+    # only the part files of behaviors recorded as done are merged
+    parts = [part_paths(parts_dir, session, animal, behavior, extension)
+             for session, animal, behavior
+             in sorted(read_manifest(manifest_path))]
+    results.merge_results(results_path, [summary for summary, _ in parts],
+                          remove=False)
+    results.merge_results(root + '.events' + extension,
+                          [events for _, events in parts],
+                          results.EVENT_COLUMNS, remove=False)
+    return outcomes
+
+
+def main():
+    table_path = sys.argv[1]
+    config_path = sys.argv[2] if len(sys.argv) > 2 else None
+    processes = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    results_path = sys.argv[4] if len(sys.argv) > 4 else 'cohort_results.csv'
+    outcomes = run_cohort(table_path, config_path, processes, results_path)
+    failed = [outcome for outcome in outcomes if outcome['error']]
+    for outcome in failed:
+        print(f"{outcome['session']} {outcome['animal']} "
+              f"{outcome['behavior']} {outcome['status']}:\n"
+              f"{outcome['error']}", file=sys.stderr)
+    print(f"{len(outcomes) - len(failed)} of {len(outcomes)} behaviors "
+          f"finished")
+
+
+if __name__ == "__main__":
+    main()
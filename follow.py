@@ -0,0 +1,239 @@
+#!/usr/bin/python3
+"""
+Contains the FollowReader class, which parses a raw data file while the
+rig is still writing it. Each poll reads only the complete lines added
+since the last poll, deinterleaves them with the same start rows as
+parsing.file_reader and appends them to ChannelBuffer arrays.
+
+The replay function copies a finished recording to a new file at N
+times the recorded speed, so FollowReader can be tried without a rig:
+
+    python follow.py recording.csv copy.csv 10
+"""
+
+import os
+import sys
+import time
+import numpy as np
+import parsing
+import readers
+
+
+class ChannelBuffer:
+    """
+    A growable array of samples. It doubles in size as samples are
+    appended. If capacity is given it stops growing at capacity and
+    then keeps only the newest capacity samples, like a ring.
+
+    Parameters
+    ----------
+    capacity: int
+        The most samples to keep. If None, every sample is kept.
+
+    size: int
+        The number of samples to allocate at first.
+    """
+    __slots__ = ('capacity', 'data', 'head', 'size')
+
+    def __init__(self, capacity=None, size=1024):
+        self.capacity = capacity
+        if capacity is not None:
+            size = min(size, capacity)
+        self.data = np.empty(size)
+        self.head = 0  # position of the oldest sample
+        self.size = 0  # number of samples held
+
+    def __len__(self):
+        return self.size
+
+    def append(self, values):
+        """
+        Objective: To add samples to the end of the buffer.
+        """
+        values = np.asarray(values, dtype=float)
+        if self.capacity is not None:
+            values = values[-self.capacity:]
+        needed = self.size + len(values)
+        if needed > len(self.data) and (self.capacity is None or
+                                        len(self.data) < self.capacity):
+            size = max(needed, 2 * len(self.data))
+            if self.capacity is not None:
+                size = min(size, self.capacity)
+            ordered = self.array()
+            self.data = np.empty(size)
+            self.data[:self.size] = ordered
+            self.head = 0
+        length = len(self.data)
+        tail = (self.head + self.size) % length
+        first = min(len(values), length - tail)
+        self.data[tail:tail+first] = values[:first]
+        self.data[:len(values)-first] = values[first:]
+        overflow = self.size + len(values) - length
+        if overflow > 0:
+            # the oldest samples were written over
+            self.head = (self.head + overflow) % length
+            self.size = length
+        else:
+            self.size += len(values)
+
+    def array(self):
+        """
+        Objective: To give the samples in the buffer, oldest first.
+        """
+        if self.head + self.size <= len(self.data):
+            return self.data[self.head:self.head+self.size]
+        return np.concatenate([self.data[self.head:],
+                               self.data[:self.head+self.size-len(self.data)]])
+
+
+class FollowReader:
+    """
+    Parses the complete lines added to a raw data file since the last
+    poll and appends each channel to a ChannelBuffer. Unlike
+    parsing.file_reader, the last rows of the file are not dropped,
+    since the file is still growing.
+
+    Parameters
+    ----------
+    filename: string
+        This will provide the file path needed to the raw data file.
+
+    start_rows: dict
+        The start row for the red, isosbestic and green channels.
+        Defaults to parsing.START_ROWS.
+
+    capacity: int
+        The most samples to keep for each channel. If None,
+        every sample is kept.
+
+    poll_interval: float
+        The seconds to wait between polls in follow.
+    """
+
+    def __init__(self, filename, start_rows=None, capacity=None,
+                 poll_interval=0.05):
+        self.filename = filename
+        self.start_rows = start_rows or parsing.START_ROWS
+        self.poll_interval = poll_interval
+        self.channels = {name: ChannelBuffer(capacity)
+                         for name in parsing.CHANNEL_NAMES}
+        self.rows = 0  # rows parsed so far
+        self.position = 0  # file offset of the first unparsed byte
+        self.partial = b''  # an incomplete last line
+        # (seconds from the file being written to the rows being
+        # parsed, rows parsed) for every poll that found new rows
+        self.latencies = []
+
+    def poll(self):
+        """
+        Objective: To parse the lines added to the file since the last poll.
+
+        Returns
+        -------
+        rows: int
+            The number of new rows parsed.
+        """
+        try:
+            with open(self.filename, 'rb') as opened_file:
+                modified = os.fstat(opened_file.fileno()).st_mtime
+                opened_file.seek(self.position)
+                new = opened_file.read()
+        except FileNotFoundError:
+            return 0
+        self.position += len(new)
+        text = self.partial + new
+        end = text.rfind(b'\n') + 1
+        self.partial = text[end:]
+        if end == 0:
+            return 0
+        data = readers.parse_text(text[:end].decode(), ndmin=2)
+
+        offset = self.rows
+        for name, column, channel, _ in parsing.CHANNELS:
+            start = self.start_rows[channel]
+            row = max(start, offset)
+            row += (start - row) % 3
+            self.channels[name].append(data[row-offset::3, column])
+        self.rows += len(data)
+        self.latencies.append((time.time() - modified, len(data)))
+        return len(data)
+
+    def follow(self, idle_timeout=None, stop=None):
+        """
+        Objective: To poll the file until it stops growing.
+
+        Parameters
+        ----------
+        idle_timeout: float
+            Stop after this many seconds without new rows.
+            If None, only stop decides when to stop.
+
+        stop: function
+            Called after every poll, following stops when it returns True.
+        """
+        idle_since = time.monotonic()
+        while True:
+            if self.poll():
+                idle_since = time.monotonic()
+            if stop is not None and stop():
+                return
+            if (idle_timeout is not None and
+                    time.monotonic() - idle_since > idle_timeout):
+                return
+            time.sleep(self.poll_interval)
+
+    def session(self):
+        """
+        Objective: To give the samples parsed so far.
+
+        Returns
+        -------
+        parsed_data : Session
+            A copy of the samples in the channel buffers.
+        """
+        return parsing.Session.pack({name: buffer.array() for name, buffer
+                                     in self.channels.items()})
+
+
+def replay(source, destination, speed=1.0, start_time=None):
+    """
+    Objective: To copy a recorded raw data file line by line, writing
+    each line when it was recorded divided by speed.
+
+    Parameters
+    ----------
+    source: string
+        The file path of the recorded raw data file.
+
+    destination: string
+        The file path to write to.
+
+    speed: float
+        How many times faster than the recording to write.
+
+    start_time: float
+        The time.time() at which to write the first line.
+        Defaults to now.
+    """
+    if start_time is None:
+        start_time = time.time()
+    with open(source) as opened_file:
+        lines = opened_file.readlines()
+    if not lines:
+        return
+    ftime = np.array([float(line.split()[0]) for line in lines])
+    due = start_time + (ftime - ftime[0]) / 1000 / speed
+    written = 0
+    with open(destination, 'w') as opened_file:
+        while written < len(lines):
+            ready = np.searchsorted(due, time.time(), side='right')
+            if ready > written:
+                opened_file.writelines(lines[written:ready])
+                opened_file.flush()
+                written = ready
+            else:
+                time.sleep(max(min(0.001, due[written] - time.time()), 0))
+
+
+if __name__ == "__main__":
+    replay(sys.argv[1], sys.argv[2], float(sys.argv[3]))
@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+"""
+Contains the function ingest, which parses a directory (or glob) of
+raw data files with parsing.file_reader across a pool of processes.
+Results come back in sorted file order, a file that fails to parse is
+reported instead of stopping the run, and progress is printed as the
+files finish. Run it from the command line with
+
+    python ingest.py <directory or glob> [processes] [store directory]
+"""
+
+import os
+import sys
+import glob
+import time
+import traceback
+import concurrent.futures
+import parsing
+import store
+
+
+# files picked up when ingest is given a directory
+RAW_PATTERN = 'FiberPhoSig*.csv'
+
+
+def find_files(source):
+    """
+    Objective: To list the raw data files to ingest.
+
+    Parameters
+    ----------
+    source: string
+        A directory, which is searched for RAW_PATTERN
+        files, or a glob pattern.
+
+
+    Returns
+    -------
+    paths: list
+        The sorted file paths.
+    """
+    if os.path.isdir(source):
+        source = os.path.join(source, RAW_PATTERN)
+    return sorted(glob.glob(source))
+
+
+def session_id(path):
+    """
+    Objective: To name the session of a raw data file in a SessionStore.
+    """
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def _ingest_file(path, store_root, reader_kwargs):
+    """
+    Objective: To parse one file in a worker process.
+    """
+    started = time.perf_counter()
+    result = {'path': path, 'session': None, 'error': None, 'bytes': 0}
+    try:
+        result['bytes'] = os.path.getsize(path)
+        parsed_data = parsing.file_reader(path, **reader_kwargs)
+        if store_root is None:
+            # pack the channels so only they are sent back
+            result['session'] = parsed_data.copy()
+        else:
+            store.SessionStore(store_root).write_session(session_id(path),
+                                                         parsed_data)
+    except Exception:
+        result['error'] = traceback.format_exc()
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+
+def ingest(source, processes=None, store_root=None, progress=True,
+           **reader_kwargs):
+    """
+    Objective: To parse many raw data files in parallel.
+
+    Parameters
+    ----------
+    source: string or list
+        A directory, a glob pattern or a list of file paths.
+
+    processes: int
+        The number of worker processes. Defaults to the number of CPUs.
+
+    store_root: string
+        If given, each session is written to the SessionStore in this
+        directory by its worker instead of being sent back.
+
+    progress: bool
+        If True, print the progress and throughput to stderr.
+
+    reader_kwargs:
+        Passed on to parsing.file_reader.
+
+
+    Returns
+    -------
+    results: list
+        One dict per file, in sorted file order, holding the 'path', the
+        parsed 'session' (None if stored or failed), the 'error'
+        traceback (None if it parsed), its size in 'bytes' and the
+        'seconds' it took to parse.
+    """
+    paths = find_files(source) if isinstance(source, str) else list(source)
+    results = [None] * len(paths)
+    started = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+        futures = {executor.submit(_ingest_file, path, store_root,
+                                   reader_kwargs): number
+                   for number, path in enumerate(paths)}
+        done_bytes = 0
+        for done, future in enumerate(
+                concurrent.futures.as_completed(futures), 1):
+            result = future.result()
+            results[futures[future]] = result
+            done_bytes += result['bytes']
+            if progress:
+                seconds = time.perf_counter() - started
+                status = 'failed' if result['error'] else 'ok'
+                print(f"[{done}/{len(paths)}] {status} {result['path']} "
+                      f"({done/seconds:.1f} files/s, "
+                      f"{done_bytes/seconds/1024**2:.1f} MB/s)",
+                      file=sys.stderr)
+    return results
+
+
+def main():
+    source = sys.argv[1]
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    store_root = sys.argv[3] if len(sys.argv) > 3 else None
+    results = ingest(source, processes, store_root)
+    failed = [result for result in results if result['error']]
+    for result in failed:
+        print(f"{result['path']}:\n{result['error']}", file=sys.stderr)
+    print(f"{len(results) - len(failed)} of {len(results)} files parsed")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,31 @@
 #!usr/bin/python3
 """
-Uses parsing and functions
+Uses pipeline and functions
 """
-import parsing
-import allfunctions
+import pipeline
+import results
 
 def main():
     raw_data = "/home/jovyan/swefs_group1/correct_test_data/FiberPhoSig2020-08-22T09_00_59.csv"
     fTimeGreen = "/home/jovyan/swefs_group1/correct_func_test_data/fTimeGreen.txt"
     sages2ndFit1 = "/home/jovyan/swefs_group1/correct_func_test_data/sages2ndFit1.txt"
     
-    parsed_data = parsing.file_reader(raw_data)
-
-    allfunctions.statistics(fTimeGreen, "/home/jovyan/swefs_group1/test_data/givesniff_start_time.txt", "/home/jovyan/swefs_group1/test_data/givesniff_stop_time.txt", sages2ndFit1)
-
-    allfunctions.statistics(fTimeGreen, "/home/jovyan/swefs_group1/test_data/receivesniff_start_time.txt", "/home/jovyan/swefs_group1/test_data/receivesniff_stop_time.txt", sages2ndFit1)
-
-    allfunctions.statistics(fTimeGreen, "/home/jovyan/swefs_group1/test_data/rear_start_time.txt", "/home/jovyan/swefs_group1/test_data/rear_stop_time.txt", sages2ndFit1)
-
-    allfunctions.statistics(fTimeGreen, "/home/jovyan/swefs_group1/test_data/push_start_time.txt", "/home/jovyan/swefs_group1/test_data/push_stop_time.txt", sages2ndFit1)
-
-    allfunctions.statistics(fTimeGreen, "/home/jovyan/swefs_group1/test_data/groomself_start_time.txt", "/home/jovyan/swefs_group1/test_data/groomself_stop_time.txt", sages2ndFit1)
+    behavior_files = ["/home/jovyan/swefs_group1/correct_test_data/givesniff.csv",
+                      "/home/jovyan/swefs_group1/correct_test_data/receivesniff.csv",
+                      "/home/jovyan/swefs_group1/correct_test_data/rear.csv",
+                      "/home/jovyan/swefs_group1/correct_test_data/push.csv",
+                      "/home/jovyan/swefs_group1/correct_test_data/groomself.csv"]
+
+    # the time points, normalized signal and all behaviors are read once
+    # and shared; without fTimeGreen and sages2ndFit1 they come from raw_data
+    session = pipeline.load_session(raw_data, behavior_files,
+                                    fluor_array=fTimeGreen,
+                                    normsig=sages2ndFit1)
+    with results.ResultsWriter("results.csv") as sink, \
+            results.ResultsWriter("event_results.csv",
+                                  results.EVENT_COLUMNS) as event_sink:
+        pipeline.session_statistics(session, sink=sink,
+                                    event_sink=event_sink)
 
 
 if __name__ == "__main__":
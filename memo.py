@@ -0,0 +1,342 @@
+#!/usr/bin/python3
+"""
+Contains the memoize decorator, which keeps the results of the analysis
+functions in allfunctions so they are not computed again for the same
+inputs. Results are keyed by a hash of the contents of the arguments
+(arrays are hashed by their bytes), of the code of the function and of
+the functions and classes of its module it calls, of the methods of the
+classes of its arguments, and of the source of these modules and of
+this one. A changed behavior file or parameter only recomputes what it
+changes, and a changed or replaced function, such as baselinestd or
+Timebase.index, also recomputes the functions that call it.
+
+Results are kept in memory, dropping the least recently used past
+max_entries, and can also be kept on disk in a directory managed by
+cache.store, which stays under max_bytes. Memoization is off until it
+is switched on:
+
+    import memo
+    memo.enable()                      # in memory only
+    memo.enable('.fiberpho_memo')      # and on disk
+"""
+
+import sys
+import types
+import pickle
+import hashlib
+import inspect
+import functools
+import collections
+import numpy as np
+import cache
+
+
+# results kept in memory
+MAX_ENTRIES = 512
+
+# the oldest results on disk are removed once they take more than this
+MAX_DISK_BYTES = 1024**3
+
+_settings = {'enabled': False, 'max_entries': MAX_ENTRIES,
+             'cache_dir': None, 'max_bytes': MAX_DISK_BYTES}
+_memory = collections.OrderedDict()
+_stats = {'hits': 0, 'disk_hits': 0, 'misses': 0}
+
+
+class _Unhashable(Exception):
+    pass
+
+
+def configure(enabled=True, cache_dir=None, max_entries=MAX_ENTRIES,
+              max_bytes=MAX_DISK_BYTES):
+    """
+    Objective: To switch memoization on or off and set where and how
+    many results are kept.
+
+    Parameters
+    ----------
+    enabled: bool
+        If False, memoized functions are called directly.
+
+    cache_dir: string
+        A directory to also keep results in across runs. If None,
+        results are only kept in memory.
+
+    max_entries: int
+        The most results to keep in memory.
+
+    max_bytes: int
+        The largest size the cache directory may grow to.
+    """
+    _settings.update(enabled=enabled, cache_dir=cache_dir,
+                     max_entries=max_entries, max_bytes=max_bytes)
+    while len(_memory) > max_entries:
+        _memory.popitem(last=False)
+
+
+def enable(cache_dir=None, **kwargs):
+    """
+    Objective: To switch memoization on. See configure.
+    """
+    configure(True, cache_dir, **kwargs)
+
+
+def disable():
+    """
+    Objective: To switch memoization off. Results kept so far stay
+    and are used again if it is switched back on.
+    """
+    _settings['enabled'] = False
+
+
+def clear():
+    """
+    Objective: To forget the results kept in memory and the hit counts.
+    Results on disk are kept.
+    """
+    _memory.clear()
+    _stats.update(hits=0, disk_hits=0, misses=0)
+
+
+def stats():
+    """
+    Objective: To give the number of results found in memory ('hits'),
+    found on disk ('disk_hits') and computed ('misses').
+    """
+    return dict(_stats, entries=len(_memory))
+
+
+def _update(digest, value):
+    """
+    Objective: To add the contents of value to a hash.
+    """
+    if isinstance(value, np.ndarray):
+        digest.update(b'ndarray' + value.dtype.str.encode() +
+                      repr(value.shape).encode())
+        if value.dtype.hasobject:
+            _update(digest, value.tolist())
+        else:
+            digest.update(np.ascontiguousarray(value).data)
+    elif value is None or isinstance(value, (bool, int, float, complex, str,
+                                             bytes, np.generic)):
+        digest.update(type(value).__name__.encode() + repr(value).encode())
+    elif isinstance(value, (list, tuple, range)):
+        digest.update(type(value).__name__.encode() +
+                      str(len(value)).encode())
+        for item in value:
+            _update(digest, item)
+    elif isinstance(value, dict):
+        digest.update(b'dict' + str(len(value)).encode())
+        for key in sorted(value, key=repr):
+            _update(digest, key)
+            _update(digest, value[key])
+    elif hasattr(type(value), '__slots__'):
+        # the classes of this repo keep their state in __slots__; their
+        # methods, which the function may call, are part of the hash
+        digest.update(code_digest(type(value)))
+        for name in type(value).__slots__:
+            _update(digest, getattr(value, name, None))
+    else:
+        try:
+            digest.update(pickle.dumps(value))
+        except Exception:
+            raise _Unhashable(type(value).__name__)
+
+
+@functools.lru_cache(maxsize=None)
+def _source_digest(module_name):
+    """
+    Objective: To give a hash of the source file of a module,
+    or b'' if it has none. It is read once, like the module.
+    """
+    try:
+        with open(inspect.getfile(sys.modules[module_name]), 'rb') as opened:
+            return hashlib.blake2b(opened.read(), digest_size=20).digest()
+    except (KeyError, TypeError, OSError):
+        return b''
+
+
+# the source of this module, which is part of every key
+_SOURCE = _source_digest(__name__)
+
+
+def _update_code(digest, code):
+    """
+    Objective: To add a code object, and the code of the lambdas and
+    comprehensions inside it, to a hash.
+    """
+    digest.update(code.co_code + repr(code.co_names).encode())
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _update_code(digest, const)
+        elif isinstance(const, frozenset):
+            # the order of a set changes between runs
+            digest.update(repr(sorted(map(repr, const))).encode())
+        else:
+            digest.update(repr(const).encode())
+
+
+def _names(code):
+    """
+    Objective: To list the global names a code object uses.
+    """
+    names = list(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names.extend(_names(const))
+    return names
+
+
+@functools.lru_cache(maxsize=None)
+def _code_summary(code):
+    """
+    Objective: To give the hash of a code object and the global names
+    it uses. Code objects do not change, so each is only read once.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    _update_code(digest, code)
+    return digest.digest(), tuple(dict.fromkeys(_names(code)))
+
+
+def code_digest(function):
+    """
+    Objective: To hash the code of function (or the methods of a
+    class) and of every function and class of its module that it uses,
+    followed through what they use in turn, as they are when called. Functions from other modules are
+    hashed without following what they use. Memoized functions are
+    followed to the function they wrap.
+
+    Returns
+    -------
+    digest: bytes
+        The hash.
+    """
+    module = function.__module__
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(_SOURCE + _source_digest(module))
+    seen = set()
+    pending = [function]
+    while pending:
+        item = pending.pop()
+        item = getattr(item, 'uncached', item)
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        if isinstance(item, type):
+            digest.update(b'class' + item.__qualname__.encode())
+            for attribute in vars(item).values():
+                attribute = getattr(attribute, '__func__', attribute)
+                if isinstance(attribute, property):
+                    attribute = attribute.fget
+                if isinstance(attribute, types.FunctionType):
+                    pending.append(attribute)
+            continue
+        code, names = _code_summary(item.__code__)
+        digest.update(item.__qualname__.encode() + code)
+        for name in names:
+            value = item.__globals__.get(name)
+            inner = getattr(value, 'uncached', value)
+            if (isinstance(inner, (type, types.FunctionType)) and
+                    getattr(inner, '__module__', None) == module):
+                pending.append(inner)
+            elif isinstance(inner, types.FunctionType):
+                # a function from elsewhere, such as one put in place of
+                # a function of the module, is hashed but not followed
+                digest.update(f"{name}={inner.__module__}."
+                              f"{inner.__qualname__}".encode() +
+                              _code_summary(inner.__code__)[0])
+    return digest.digest()
+
+
+def content_key(name, code, arguments):
+    """
+    Objective: To give the key of a call from the function's name, its
+    code and the contents of its arguments.
+
+    Returns
+    -------
+    key: string
+        The key, with no '-' so each key is its own cache.store entry.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(code)
+    _update(digest, arguments)
+    return f"memo_{name}_{digest.hexdigest()}"
+
+
+def _freeze(value):
+    """
+    Objective: To make the arrays of a result read-only, so a caller
+    cannot change the result kept for later calls.
+    """
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _freeze(item)
+    elif isinstance(value, dict):
+        for item in value.values():
+            _freeze(item)
+    return value
+
+
+def _load_disk(key):
+    stored = cache.load(_settings['cache_dir'], key)
+    if stored is None:
+        return None
+    return (pickle.loads(stored['value'].tobytes()),)
+
+
+def _store_disk(key, value):
+    try:
+        pickled = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        cache.store(_settings['cache_dir'], key,
+                    {'value': np.frombuffer(pickled, dtype=np.uint8)},
+                    _settings['max_bytes'])
+    except (OSError, pickle.PicklingError, TypeError, AttributeError):
+        # a result that cannot be kept on disk is still kept in memory
+        pass
+
+
+def memoize(function):
+    """
+    Objective: To keep the results of function for the contents of its
+    arguments while memoization is enabled. Arguments that cannot be
+    hashed make the function be called directly.
+    """
+    signature = inspect.signature(function)
+    name = function.__qualname__.replace('.', '_')
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _settings['enabled']:
+            return function(*args, **kwargs)
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        try:
+            key = content_key(name, code_digest(function), bound.arguments)
+        except _Unhashable:
+            return function(*args, **kwargs)
+
+        if key in _memory:
+            _memory.move_to_end(key)
+            _stats['hits'] += 1
+            return _memory[key]
+        found = None
+        if _settings['cache_dir'] is not None:
+            found = _load_disk(key)
+        if found is not None:
+            _stats['disk_hits'] += 1
+            value = _freeze(found[0])
+        else:
+            _stats['misses'] += 1
+            value = _freeze(function(*args, **kwargs))
+            if _settings['cache_dir'] is not None:
+                _store_disk(key, value)
+        _memory[key] = value
+        while len(_memory) > _settings['max_entries']:
+            _memory.popitem(last=False)
+        return value
+
+    wrapper.uncached = function
+    return wrapper
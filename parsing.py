@@ -2,13 +2,415 @@
 """
 Contains the function file_reader which will parse the columns in
 the data file given, and deinterleave the time and fluorescence.
+Long recordings can be streamed in fixed-size chunks with
+iter_file_chunks. The channels are returned in a Session, whose
+arrays are 1-D views into one buffer.
 """
 
 import sys
+import itertools
+import configparser
 import numpy as np
+import cache
+import readers
 
 
-def file_reader(filename):
+# default rows where the red, isosbestic and green channels start
+START_ROWS = {'red': 24, 'isosbestic': 25, 'green': 26}
+
+# number of rows read at a time when streaming a file
+CHUNKSIZE = 100000
+
+# rows between the entries of the time index
+INDEX_EVERY = 1000
+
+# bytes read at a time when building the time index
+INDEX_BLOCKSIZE = 16 * 1024**2
+
+# (name, data column, channel, rows dropped from the end of the file)
+CHANNELS = (('fTimeRed', 0, 'red', 2),
+            ('fTimeIsosbestic', 0, 'isosbestic', 1),
+            ('fTimeGreen', 0, 'green', 1),
+            ('f1red', 5, 'red', 2),
+            ('f1isosbestic', 3, 'isosbestic', 1),
+            ('f1green', 3, 'green', 1),
+            ('f2red', 4, 'red', 2),
+            ('f2isosbestic', 2, 'isosbestic', 1),
+            ('f2green', 2, 'green', 1))
+
+CHANNEL_NAMES = tuple(name for name, _, _, _ in CHANNELS)
+
+# the channels in the order they are labelled by detect_phase
+PHASES = ('red', 'isosbestic', 'green')
+
+# column holding the LED state flags, and the flag bit for each channel
+LED_COLUMN = 1
+LED_FLAGS = {'red': 4, 'isosbestic': 1, 'green': 2}
+
+
+class Session:
+    """
+    Holds the deinterleaved channels of one recording. Each channel is
+    a 1-D view into the single buffer, so no channel owns its data.
+    Channels can be used as attributes (session.fTimeGreen) or like a
+    dict (session['fTimeGreen']), which is what file_reader returned
+    before. Use copy() when arrays that own their data are needed.
+
+    Parameters
+    ----------
+    buffer: array
+        This 2-D array holds the data for every channel.
+
+    layout: dict
+        This dict holds (column, start, stop, step) for each channel,
+        where the channel is buffer[start:stop:step, column].
+    """
+    __slots__ = ('buffer', 'layout') + CHANNEL_NAMES
+
+    def __init__(self, buffer, layout):
+        self.buffer = buffer
+        self.layout = layout
+        for name, (column, start, stop, step) in layout.items():
+            setattr(self, name, buffer[start:stop:step, column])
+
+    @classmethod
+    def pack(cls, arrays):
+        """
+        Objective: To build a Session from separate channel arrays by
+        copying them into one buffer, one contiguous column per channel.
+
+        Parameters
+        ----------
+        arrays: dict
+            This dict holds an array, or a list of arrays to be
+            joined end to end, for each channel in CHANNEL_NAMES.
+
+
+        Returns
+        -------
+        session: Session
+            The Session holding a copy of the arrays.
+        """
+        pieces = {name: arrays[name] if isinstance(arrays[name], list)
+                  else [arrays[name]] for name in CHANNEL_NAMES}
+        lengths = {name: sum(len(piece) for piece in pieces[name])
+                   for name in CHANNEL_NAMES}
+        buffer = np.empty((max(lengths.values(), default=0),
+                           len(CHANNEL_NAMES)), order='F')
+        layout = {}
+        for column, name in enumerate(CHANNEL_NAMES):
+            start = 0
+            for piece in pieces[name]:
+                buffer[start:start+len(piece), column] = piece
+                start += len(piece)
+            layout[name] = (column, 0, lengths[name], 1)
+        return cls(buffer, layout)
+
+    def copy(self):
+        """
+        Objective: To give a Session whose buffer holds only the
+        channels and is not shared with this Session.
+        """
+        return Session.pack({name: getattr(self, name)
+                             for name in self.layout})
+
+    def keys(self):
+        return self.layout.keys()
+
+    def values(self):
+        return [getattr(self, name) for name in self.layout]
+
+    def items(self):
+        return [(name, getattr(self, name)) for name in self.layout]
+
+    def __getitem__(self, name):
+        if name not in self.layout:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def __contains__(self, name):
+        return name in self.layout
+
+    def __iter__(self):
+        return iter(self.layout)
+
+    def __len__(self):
+        return len(self.layout)
+
+    def __reduce__(self):
+        # pickle the buffer once instead of every view
+        return (Session, (np.asarray(self.buffer), self.layout))
+
+    def __repr__(self):
+        return f"Session({len(self.fTimeGreen)} green samples)"
+
+
+def start_rows_from_config(config_path):
+    """
+    Objective: To read the channel start rows from the
+    [FLUORESCENCE START ROWS] section of a config file.
+
+    Parameters
+    ----------
+    config_path: string
+        This will provide the file path to the config.ini file.
+
+
+    Returns
+    -------
+    start_rows : dict
+        This dict holds the start row for the red,
+        isosbestic and green channels.
+    """
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    section = config['FLUORESCENCE START ROWS']
+    return {channel: section.getint(channel) for channel in START_ROWS}
+
+
+def iter_file_chunks(filename, chunksize=CHUNKSIZE, start_rows=None):
+    """
+    Objective: To deinterleave the raw data file a chunk at a time so
+    memory use is bounded by chunksize instead of the recording length.
+
+    Parameters
+    ----------
+    filename: string
+        This will provide the file path needed to the raw data file.
+
+    chunksize: int
+        The number of rows to read from the file at a time.
+
+    start_rows: dict
+        The start row for the red, isosbestic and green channels.
+        Defaults to START_ROWS.
+
+
+    Yields
+    ------
+    chunk : dict
+        This dict holds the next piece of every channel returned by
+        file_reader. Concatenating the chunks gives the same arrays
+        as reading the whole file at once.
+    """
+    if start_rows is None:
+        start_rows = START_ROWS
+    # the last rows may be dropped, so hold them back until the end
+    holdback = max(drop for _, _, _, drop in CHANNELS)
+    offset = 0  # row number of the first row in pending
+    pending = np.empty((0, 6))
+    with open(filename) as opened_file:
+        while True:
+            lines = list(itertools.islice(opened_file, chunksize))
+            final = len(lines) < chunksize
+            if lines:
+                block = readers.parse_text(lines, ndmin=2)
+                pending = np.concatenate([pending, block])
+            end = offset + len(pending)
+            chunk = {}
+            for name, column, channel, drop in CHANNELS:
+                start = start_rows[channel]
+                stop = end - drop if final else end - holdback
+                # first row of this channel at or after offset
+                first = max(start, offset)
+                first += (start - first) % 3
+                # a copy, so the chunk does not keep pending alive
+                chunk[name] = pending[first-offset:max(stop-offset, 0):3,
+                                      column].copy()
+            yield chunk
+            if final:
+                return
+            keep = min(holdback, len(pending))
+            pending = pending[len(pending)-keep:]
+            offset = end - keep
+
+
+def detect_phase(data, start_rows=None, led_column=LED_COLUMN):
+    """
+    Objective: To find which channel every row of the raw data belongs
+    to, so a dropped LED frame does not shift every later sample into
+    the wrong channel.
+
+    The LED state flags are used when every row has exactly one of the
+    LED_FLAGS bits set. Otherwise the frame number of each row is worked
+    out from the timestamps, counting a gap of about k frame periods as
+    k - 1 dropped frames, and the start rows give the phase of frame 0.
+    Frames in a red, isosbestic, green cycle that lost one of its
+    channels are masked, so the three channels stay sample aligned.
+
+    Parameters
+    ----------
+    data: array
+        This 2-D array holds the raw data file.
+
+    start_rows: dict
+        The start row for the red, isosbestic and green channels. Rows
+        before the first start row are masked. Defaults to START_ROWS.
+
+    led_column: int
+        The column of data holding the LED state flags.
+
+
+    Returns
+    -------
+    labels : array
+        This array holds the index into PHASES of the
+        channel of each row, or -1 if it is unknown.
+
+    valid : array
+        This boolean array is True for rows that
+        belong to a complete cycle.
+    """
+    if start_rows is None:
+        start_rows = START_ROWS
+    rows = len(data)
+    labels = np.full(rows, -1, dtype=np.int8)
+
+    flags = data[:, led_column].astype(np.int64) & 7
+    for label, channel in enumerate(PHASES):
+        labels[flags == LED_FLAGS[channel]] = label
+    first = min(start_rows.values())
+    if (labels[first:] < 0).any():
+        # no usable flags, so count frames from the timestamps
+        ftime = data[:, 0]
+        period = np.median(np.diff(ftime))
+        steps = np.maximum(np.rint(np.diff(ftime) / period), 1)
+        frame = np.concatenate([[0], np.cumsum(steps)]).astype(np.int64)
+        lookup = np.empty(3, dtype=np.int8)
+        for label, channel in enumerate(PHASES):
+            lookup[start_rows[channel] % 3] = label
+        labels = lookup[frame % 3]
+    labels[:first] = -1
+
+    # a new cycle starts whenever the channel order wraps around
+    labelled = np.flatnonzero(labels >= 0)
+    wraps = np.diff(labels[labelled], prepend=PHASES.index('green')) <= 0
+    cycle = np.cumsum(wraps) - 1
+    counts = np.bincount(cycle * 3 + labels[labelled],
+                         minlength=3 * (cycle[-1] + 1 if len(cycle) else 0))
+    complete = (counts.reshape(-1, 3) == 1).all(axis=1)
+    valid = np.zeros(rows, dtype=bool)
+    valid[labelled] = complete[cycle]
+    return labels, valid
+
+
+def deinterleave(data, labels, valid):
+    """
+    Objective: To split the raw data into the channels
+    using the labels from detect_phase.
+
+    Parameters
+    ----------
+    data: array
+        This 2-D array holds the raw data file.
+
+    labels : array
+        This array holds the index into PHASES of the channel of each row.
+
+    valid : array
+        This boolean array is True for the rows to keep.
+
+
+    Returns
+    -------
+    parsed_data : Session
+        This Session holds the same channels as file_reader returns.
+    """
+    arrays = {}
+    row = np.arange(len(data))
+    for name, column, channel, drop in CHANNELS:
+        # the last rows are dropped as in file_reader's config mode
+        keep = (valid & (labels == PHASES.index(channel)) &
+                (row < len(data) - drop))
+        arrays[name] = data[keep, column]
+    return Session.pack(arrays)
+
+
+def build_time_index(filename, every=INDEX_EVERY):
+    """
+    Objective: To find the byte offset and timestamp of every
+    every-th row of the raw data file, so a time range can be read
+    without parsing the rows before it.
+
+    Parameters
+    ----------
+    filename: string
+        This will provide the file path needed to the raw data file.
+
+    every: int
+        The number of rows between index entries.
+
+
+    Returns
+    -------
+    index: dict
+        This dict holds the row number ('rows'), byte offset
+        ('offsets') and timestamp ('times') of each entry, and the
+        number of rows and bytes in the file ('total').
+    """
+    offsets = [np.zeros(1, dtype=np.int64)]
+    position = 0
+    rows = 1  # rows started so far, the first at offset 0
+    last_byte = b'\n'
+    with open(filename, 'rb') as opened_file:
+        for block in iter(lambda: opened_file.read(INDEX_BLOCKSIZE), b''):
+            # every newline starts a new row
+            starts = np.flatnonzero(np.frombuffer(block, np.uint8) == 10)
+            starts += position + 1
+            numbers = rows + np.arange(len(starts))
+            offsets.append(starts[numbers % every == 0])
+            rows += len(starts)
+            position += len(block)
+            last_byte = block[-1:]
+        offsets = np.concatenate(offsets)
+        # a newline at the very end does not start a row
+        if last_byte == b'\n':
+            rows -= 1
+            offsets = offsets[offsets < position]
+        times = np.empty(len(offsets))
+        for entry, offset in enumerate(offsets):
+            opened_file.seek(offset)
+            times[entry] = float(opened_file.readline().split()[0])
+    return {'rows': np.arange(len(offsets), dtype=np.int64) * every,
+            'offsets': offsets,
+            'times': times,
+            'total': np.array([rows, position], dtype=np.int64)}
+
+
+def _read_time_range(filename, index, start_rows, t_start, t_stop):
+    """
+    Objective: To deinterleave only the rows of the raw data
+    file with timestamps between t_start and t_stop.
+    """
+    times = index['times']
+    first = max(np.searchsorted(times, t_start, side='right') - 1, 0)
+    last = np.searchsorted(times, t_stop, side='right')
+    total_rows, size = index['total']
+    end = index['offsets'][last] if last < len(times) else size
+    data = np.empty((0, 6))
+    if end > index['offsets'][first]:
+        with open(filename, 'rb') as opened_file:
+            opened_file.seek(index['offsets'][first])
+            text = opened_file.read(end - index['offsets'][first]).decode()
+        data = readers.parse_text(text, ndmin=2)
+
+    offset = index['rows'][first]  # row number of the first row read
+    arrays = {}
+    for name, column, channel, drop in CHANNELS:
+        start = start_rows[channel]
+        row = max(start, offset)
+        row += (start - row) % 3
+        stop = min(total_rows - drop, offset + len(data))
+        rows = data[row-offset:max(stop-offset, 0):3]
+        ftime = rows[:, 0]
+        keep = (ftime >= t_start) & (ftime <= t_stop)
+        arrays[name] = rows[keep, column]
+    return Session.pack(arrays)
+
+
+def file_reader(filename, chunksize=None, start_rows=None,
+                cache_dir=None, use_cache=True, phase='config',
+                t_start=None, t_stop=None):
     """
     Objective: To deinterleave the time and fluorescence for the red,
     isosbestic, and green channels.
@@ -18,9 +420,45 @@ def file_reader(filename):
     filename: string
         This will provide the file path needed to the raw data file.
 
+    chunksize: int
+        If given, the file is streamed chunksize rows at a time with
+        iter_file_chunks instead of being loaded whole.
+
+    start_rows: dict
+        The start row for the red, isosbestic and green channels.
+        Defaults to START_ROWS.
+
+    cache_dir: string
+        The directory for the cache of parsed files.
+        Defaults to a directory next to the raw data file.
+
+    use_cache: bool
+        If True, the parsed arrays are stored in cache_dir and read back
+        as memory-mapped arrays the next time the same file is parsed
+        with the same start rows. The arrays are read-only, on the first
+        call as on later ones; use Session.copy() to change them.
+
+    phase: string
+        'config' takes every third row from the start rows. 'auto'
+        finds the channel of each row with detect_phase, which repairs
+        dropped frames; it needs the whole file, so chunksize must
+        be None.
+
+    t_start: float
+        If t_start or t_stop is given, only the samples with timestamps
+        between them are returned. A sparse index of row offsets is
+        built on the first such call and kept in cache_dir, and later
+        calls read only the rows in the range. Needs phase='config'.
+
+    t_stop: float
+        The last timestamp of the range, see t_start.
+
 
     Returns
     -------
+    parsed_data : Session
+        This Session holds the 1-D channel arrays below.
+
     fTimeRed : array
         This array holds the timestamps for the red fluorescence.
 
@@ -54,48 +492,91 @@ def file_reader(filename):
         This array holds the floats for the
         green fluorescence for the partner or stranger.
     """
-    data = np.loadtxt(filename)
-
-    # time column
-    ftime = data[:, [0]]  # timestamps
-    ftimemin = ftime / (60*1000)
-
-    # identifying fluorescent columns
-    fgreen1 = data[:, [3]]  # green for vole 1 (subject)
-    fgreen2 = data[:, [2]]  # green for vole 2 (stranger or partner)
-    fred1 = data[:, [5]]  # red for vole 1
-    fred2 = data[:, [4]]  # red for vole 2
-    last = len(fgreen1)  # len of green vole 1
-
-    # deinterleaving fluroescence for vole 1
-    f1red = fred1[24:last-2:3]
-    f1isosbestic = fgreen1[25:last-1:3]
-    f1green = fgreen1[26:last-1:3]
-
-    # deinterleaving fluroescence for vole 2
-    f2red = fred2[24:last-2:3]
-    f2isosbestic = fgreen2[25:last-1:3]
-    f2green = fgreen2[26:last-1:3]
-
-    # deinterleaving time
-    fTimeRed = ftime[24:last-2:3]
-    fTimeIsosbestic = ftime[25:last-1:3]
-    fTimeGreen = ftime[26:last-1:3]
-    
-    # getting Time in minutes
-#     Timemin = fTimeGreen - fTimeGreen[0]
-#     Timemin = Timemin / 60000
-    
-    parsed_data = {'fTimeRed': fTimeRed,
-                   'fTimeIsosbestic': fTimeIsosbestic,
-                   'fTimeGreen': fTimeGreen,
-                   'f1red': f1red,
-                   'f1isosbestic': f1isosbestic,
-                   'f1green': f1green,
-                   'f2red': f2red,
-                   'f2isosbestic': f2isosbestic,
-                   'f2green': f2green}
-    return parsed_data
+    if start_rows is None:
+        start_rows = START_ROWS
+    if phase not in ('config', 'auto'):
+        raise ValueError("phase should be 'config' or 'auto'")
+    if phase == 'auto' and chunksize is not None:
+        raise ValueError("phase='auto' cannot be used with chunksize")
+    if t_start is not None or t_stop is not None:
+        if phase != 'config':
+            raise ValueError("t_start and t_stop need phase='config'")
+        index = _time_index(filename, cache_dir, use_cache)
+        if t_start is None:
+            t_start = -np.inf
+        if t_stop is None:
+            t_stop = np.inf
+        return _read_time_range(filename, index, start_rows, t_start, t_stop)
+    if not use_cache:
+        return _parse_file(filename, chunksize, start_rows, phase)
+
+    if cache_dir is None:
+        cache_dir = cache.default_cache_dir(filename)
+    key = cache.cache_key(filename, {'start_rows': start_rows,
+                                     'phase': phase})
+    cached = cache.load(cache_dir, key)
+    if cached is not None:
+        layout = {name: (column, 0, int(length), 1) for column, (name, length)
+                  in enumerate(zip(CHANNEL_NAMES, cached['lengths']))}
+        return Session(cached['buffer'], layout)
+
+    parsed_data = _parse_file(filename, chunksize, start_rows, phase)
+    packed = parsed_data.copy()
+    lengths = np.array([len(packed[name]) for name in CHANNEL_NAMES])
+    try:
+        cache.store(cache_dir, key, {'buffer': packed.buffer,
+                                     'lengths': lengths})
+    except OSError:
+        # a read-only data directory just means no caching
+        pass
+    # read-only like the memory-mapped arrays of later calls
+    packed.buffer.flags.writeable = False
+    return Session(packed.buffer, packed.layout)
+
+
+def _time_index(filename, cache_dir, use_cache):
+    """
+    Objective: To give the time index of the raw data file for
+    file_reader, reading it from the cache when it is there.
+    """
+    if not use_cache:
+        return build_time_index(filename)
+    if cache_dir is None:
+        cache_dir = cache.default_cache_dir(filename)
+    key = cache.cache_key(filename, {'every': INDEX_EVERY}, kind='index',
+                          content_hash=False)
+    index = cache.load(cache_dir, key)
+    if index is None:
+        index = build_time_index(filename)
+        try:
+            cache.store(cache_dir, key, index)
+        except OSError:
+            pass
+    return index
+
+
+def _parse_file(filename, chunksize, start_rows, phase):
+    """
+    Objective: To parse the raw data file for file_reader
+    without using the cache.
+    """
+    if chunksize is not None:
+        chunks = {name: [] for name in CHANNEL_NAMES}
+        for chunk in iter_file_chunks(filename, chunksize, start_rows):
+            for name, array in chunk.items():
+                chunks[name].append(array)
+        return Session.pack(chunks)
+
+    data = readers.read_array(filename, ndmin=2)
+    if phase == 'auto':
+        labels, valid = detect_phase(data, start_rows)
+        return deinterleave(data, labels, valid)
+
+    last = len(data)
+    # every channel is a strided view of the loaded data
+    layout = {name: (column, start_rows[channel], last - drop, 3)
+              for name, column, channel, drop in CHANNELS}
+    return Session(data, layout)
 
 
 def main():
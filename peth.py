@@ -0,0 +1,172 @@
+#!/usr/bin/python3
+"""
+Contains the function peth, which makes peri-event time histograms of
+the normalized signal for every behavior in a session at once.
+
+Windows are given in seconds and turned into sample counts with the
+sample rate measured by a Timebase, so the same settings give the same
+windows on rigs that sample at different rates. The samples around each
+event are normalized to a baseline window, averaged into bins on a
+common time grid, and the bins are averaged over the events.
+"""
+
+import numpy as np
+import allfunctions
+from timebase import Timebase
+
+
+NORMALIZATIONS = ('zscore', 'subtract', None)
+
+
+def bin_matrix(times, edges):
+    """
+    Objective: To give a matrix that sums the samples at times
+    into the bins between edges.
+
+    Parameters
+    ----------
+    times: array
+        The time of each sample, in seconds from the event.
+
+    edges: array
+        The edges of the bins, in seconds from the event.
+
+
+    Returns
+    -------
+    weights: array
+        This (samples x bins) array is 1 where a sample is in a bin.
+        Samples outside the edges are in no bin.
+    """
+    bins = np.searchsorted(edges, times, side='right') - 1
+    inside = (bins >= 0) & (bins < len(edges) - 1)
+    weights = np.zeros((len(times), len(edges) - 1))
+    weights[np.flatnonzero(inside), bins[inside]] = 1.0
+    return weights
+
+
+def _event_mean(binned):
+    """
+    Objective: To find the mean and standard error over events of each
+    bin, skipping nan. Bins with fewer than two events have no error.
+    """
+    valid = ~np.isnan(binned)
+    counts = valid.sum(axis=0)
+    values = np.where(valid, binned, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = values.sum(axis=0) / counts
+        deviations = np.where(valid, binned - mean, 0.0)
+        std = np.sqrt((deviations**2).sum(axis=0) / (counts - 1))
+        sem = np.where(counts > 1, std / np.sqrt(counts), np.nan)
+    return mean, sem, counts
+
+
+def peth(fluor_array, normsig, events, behaviors=None, pre=5.0, post=10.0,
+         baseline=(-5.0, 0.0), bin_width=0.5, normalize='zscore',
+         timebase=None):
+    """
+    Objective: To make the peri-event time histogram of every behavior.
+
+    Parameters
+    ----------
+    fluor_array: list
+        This numpy array contains of all the time points corresponding
+        to the green channel, in ms.
+
+    normsig: list
+        This numpy array contains the normalized
+        fluroescent values for the green channel.
+
+    events: BehaviorEvents
+        The events of every behavior, from boris.load_boris.
+
+    behaviors: list
+        The behaviors to use. Defaults to all of them.
+
+    pre: float
+        The seconds before each event start to include.
+
+    post: float
+        The seconds after each event start to include.
+
+    baseline: tuple
+        The start and end of the baseline window in seconds from each
+        event start, for example (-5, 0) for the 5 s before it. Only the
+        part of the window inside the recording is used.
+
+    bin_width: float
+        The width of the bins in seconds.
+
+    normalize: str
+        'zscore' turns each event into zscores with the mean and standard
+        deviation of its own baseline, 'subtract' only subtracts the
+        baseline mean and None leaves normsig as it is.
+
+    timebase: Timebase
+        The Timebase of fluor_array. It is made here if not given.
+
+
+    Returns
+    -------
+    histograms: dict
+        This dict holds a dict for each behavior with the bin centers in
+        seconds ('bins'), the mean ('mean') and standard error ('sem')
+        over events of each bin and the number of events in each bin
+        ('counts'), the (events x bins) array of each event ('binned'),
+        and the (events x samples) array it was binned from ('epochs')
+        with the time of each sample in seconds ('times'). Samples
+        outside the recording are nan.
+    """
+    if normalize not in NORMALIZATIONS:
+        raise ValueError(f"normalize should be one of {NORMALIZATIONS}")
+    if timebase is None:
+        timebase = Timebase(fluor_array)
+    normsig = np.asarray(normsig, dtype=float).ravel()
+    if behaviors is None:
+        behaviors = events.behaviors
+    alignments = allfunctions.align_behaviors(fluor_array, events, behaviors,
+                                              timebase)
+    found = list(alignments)
+    start_loc = np.concatenate([alignments[behavior]['start_loc']
+                                for behavior in found] or [[]])
+    start_loc = start_loc.astype(np.int64)
+    counts = [len(alignments[behavior]['start_loc']) for behavior in found]
+
+    # the samples around every event of every behavior in one array
+    pre_samples, post_samples = timebase.samples(pre), timebase.samples(post)
+    epoch_fluor, _ = allfunctions.epochs(normsig, start_loc, pre_samples,
+                                         post_samples)
+    times = timebase.seconds(np.arange(-pre_samples, post_samples))
+
+    if normalize is not None:
+        summary = allfunctions.SignalSummary(normsig)
+        first = np.clip(start_loc + timebase.samples(baseline[0]),
+                        0, len(normsig))
+        last = np.clip(start_loc + timebase.samples(baseline[1]),
+                       0, len(normsig))
+        base_mean, base_std, _ = summary.window(first, last)
+        epoch_fluor = epoch_fluor - base_mean[:, None]
+        if normalize == 'zscore':
+            with np.errstate(invalid='ignore', divide='ignore'):
+                epoch_fluor = epoch_fluor / base_std[:, None]
+
+    # average the samples in each bin with one matrix product
+    nbins = max(int(round((pre + post) / bin_width)), 1)
+    edges = -pre + bin_width * np.arange(nbins + 1)
+    weights = bin_matrix(times, edges)
+    valid = ~np.isnan(epoch_fluor)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        binned = (np.where(valid, epoch_fluor, 0.0) @ weights /
+                  (valid @ weights))
+    bins = (edges[:-1] + edges[1:]) / 2
+
+    histograms = {}
+    bounds = np.cumsum(counts)[:-1]
+    for behavior, behavior_binned, behavior_epochs in zip(
+            found, np.split(binned, bounds), np.split(epoch_fluor, bounds)):
+        mean, sem, event_counts = _event_mean(behavior_binned)
+        histograms[behavior] = {'bins': bins, 'mean': mean, 'sem': sem,
+                                'counts': event_counts,
+                                'binned': behavior_binned,
+                                'epochs': behavior_epochs, 'times': times}
+    return histograms
@@ -0,0 +1,226 @@
+#!/usr/bin/python3
+"""
+Contains the functions to analyse a whole session from memory: the raw
+data file is parsed once with parsing.file_reader, the fluorescence is
+normalized to its exponential fit, the BORIS events of every behavior
+are aligned with one search, and allfunctions.behavior_statistics is
+run for each behavior on the same arrays.
+"""
+
+import numpy as np
+import allfunctions
+import boris
+import ingest
+import parsing
+import results
+import store
+from timebase import Timebase
+
+
+# decay rates tried by exp2_fit, per recording length
+RATES = np.concatenate([-np.geomspace(0.01, 500, 48), [0.0],
+                        np.geomspace(0.01, 5, 16)])
+
+# times the rates around the best pair are searched again
+FIT_ROUNDS = 6
+
+
+def _best_pair(basis, signal):
+    """
+    Objective: To find the pair of basis rows whose least squares
+    combination is closest to signal.
+
+    Returns
+    -------
+    i, j: int
+        The rows of the best pair.
+
+    coef: array
+        The weights of rows i and j.
+    """
+    gram = basis @ basis.T
+    rhs = basis @ signal
+    diagonal = np.diag(gram)
+    det = diagonal[:, None] * diagonal[None, :] - gram**2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        a = (rhs[:, None] * diagonal[None, :] - rhs[None, :] * gram) / det
+        c = (rhs[None, :] * diagonal[:, None] - rhs[:, None] * gram) / det
+        # the part of signal @ signal the least squares fit explains
+        explained = a * rhs[:, None] + c * rhs[None, :]
+    # pairs that are (nearly) the same rate cannot be told apart
+    singular = det <= 1e-9 * diagonal[:, None] * diagonal[None, :]
+    explained[singular | np.isnan(explained)] = -np.inf
+    i, j = np.unravel_index(np.argmax(explained), explained.shape)
+    return i, j, np.array([a[i, j], c[i, j]])
+
+
+def exp2_fit(times, signal):
+    """
+    Objective: To fit a*exp(b*t) + c*exp(d*t) to the signal, like the
+    'exp2' fit sages2ndFit1 was made with, without scipy.
+
+    For a pair of rates b and d the best a and c come from linear least
+    squares, so every pair of RATES is tried at once and the rates
+    around the best pair are then searched more finely.
+
+    Parameters
+    ----------
+    times: array
+        The time points of the signal.
+
+    signal: array
+        The fluorescence values.
+
+
+    Returns
+    -------
+    fit: array
+        The fitted curve at each time point.
+    """
+    times = np.asarray(times, dtype=float).ravel()
+    signal = np.asarray(signal, dtype=float).ravel()
+    span = times[-1] - times[0] if len(times) > 1 else 0.0
+    scaled = (times - times[0]) / span if span > 0 else np.zeros(len(times))
+    rates = RATES
+    for _ in range(FIT_ROUNDS):
+        basis = np.exp(rates[:, None] * scaled[None, :])
+        i, j, coef = _best_pair(basis, signal)
+        best = rates[[i, j]]
+        # a finer grid of rates around each of the best pair
+        step = np.maximum(np.abs(best) * 0.5, 1e-3)
+        rates = np.unique(np.concatenate([
+            rate + np.linspace(-width, width, 21)
+            for rate, width in zip(best, step)]))
+    return np.exp(best[:, None] * scaled[None, :]).T @ coef
+
+
+def normalize(times, signal):
+    """
+    Objective: To divide the signal by its exp2_fit, which removes the
+    photobleaching decay and gives values around 1 like sages2ndFit1.
+    """
+    signal = np.asarray(signal, dtype=float).ravel()
+    return signal / exp2_fit(times, signal)
+
+
+def load_session(raw_path, boris_paths, animal='subject', color='green',
+                 fluor_array=None, normsig=None, **reader_kwargs):
+    """
+    Objective: To load everything needed to analyse one session once.
+
+    Parameters
+    ----------
+    raw_path: string
+        This will provide the file path needed to the raw data file.
+
+    boris_paths: string or list
+        The BORIS export files of the session.
+
+    animal: string
+        One of the keys of store.ANIMALS, as in the [ANIMALS] config
+        section.
+
+    color: string
+        'red', 'isosbestic' or 'green'.
+
+    fluor_array: string or array
+        The time points to use instead of those in the raw data file,
+        such as fTimeGreen.txt.
+
+    normsig: string or array
+        The normalized signal to use instead of normalizing the raw
+        data, such as sages2ndFit1.txt. If fluor_array and normsig are
+        both given, the raw data file is not read.
+
+    reader_kwargs:
+        Passed on to parsing.file_reader.
+
+
+    Returns
+    -------
+    session: dict
+        This dict holds the time points ('fluor_array'), the normalized
+        signal ('normsig'), their Timebase ('timebase'), the
+        BehaviorEvents of every behavior ('events') and the 'session'
+        and 'animal' names written with the results.
+    """
+    if fluor_array is None or normsig is None:
+        parsed_data = parsing.file_reader(raw_path, **reader_kwargs)
+        if fluor_array is None:
+            fluor_array = parsed_data[store.TIME_CHANNELS[color]]
+        if normsig is None:
+            signal = parsed_data[store.ANIMALS[animal] + color]
+            normsig = normalize(fluor_array, signal)
+    fluor_array = np.asarray(allfunctions.file2numpy(fluor_array),
+                             dtype=float).ravel()
+    normsig = np.asarray(allfunctions.file2numpy(normsig),
+                         dtype=float).ravel()
+    return {'fluor_array': fluor_array, 'normsig': normsig,
+            'timebase': Timebase(fluor_array),
+            'events': boris.load_boris(boris_paths),
+            'session': ingest.session_id(raw_path) if raw_path else '',
+            'animal': animal}
+
+
+def session_statistics(session, behaviors=None, after=5.0, prior=5.0,
+                       sink=None, event_sink=None):
+    """
+    Objective: To find the auc, max zscore and location of the max zscore
+    of every behavior in a session loaded by load_session.
+
+    Windows are given in seconds and turned into sample counts with the
+    sample rate measured by the session's Timebase, so the seconds
+    written to sink are right whatever rate the rig sampled at. (The
+    path-based allfunctions.statistics keeps the old windows of 300
+    samples, but also writes its latencies with the measured rate.)
+
+    Parameters
+    ----------
+    session: dict
+        The session from load_session.
+
+    behaviors: list
+        The behaviors to analyse, for example from
+        boris.behaviors_from_config. Defaults to all of them.
+
+    after: float
+        The seconds after the start of each event to zscore.
+
+    prior: float
+        The seconds of baseline before each event.
+
+    sink: ResultsWriter
+        If given, a results.SUMMARY_COLUMNS row is
+        added to it for each behavior.
+
+    event_sink: ResultsWriter
+        If given, a results.EVENT_COLUMNS row is
+        added to it for each event.
+
+
+    Returns
+    -------
+    statistics: dict
+        This dict holds the behavior_statistics result of each behavior.
+    """
+    events = session['events']
+    timebase = session['timebase']
+    if behaviors is None:
+        behaviors = events.behaviors
+    behaviors = [behavior for behavior in behaviors if behavior in events]
+    alignments = allfunctions.align_behaviors(session['fluor_array'], events,
+                                              behaviors, timebase)
+    statistics = {}
+    for behavior in behaviors:
+        start, stop = events[behavior]
+        result = allfunctions.behavior_statistics(
+            session['fluor_array'], start, stop, session['normsig'],
+            timebase.samples(after), timebase.samples(prior),
+            timebase.sample_rate, alignments[behavior])
+        statistics[behavior] = result
+        names = {'session': session['session'], 'animal': session['animal']}
+        if sink is not None:
+            sink.append(results.summary_row(result, behavior, **names))
+        if event_sink is not None:
+            event_sink.extend(**results.event_rows(result, behavior, **names))
+    return statistics
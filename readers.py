@@ -0,0 +1,129 @@
+#!/usr/bin/python3
+"""
+Contains the text readers used by parsing.file_reader and
+allfunctions.file2numpy. Every backend gives the same array as
+np.loadtxt (float64 and the same shape):
+1. numpy: parses the raw text in one np.fromstring call.
+
+2. loadtxt: np.loadtxt, used whenever the numpy backend cannot
+read the text.
+
+From NumPy 1.23 np.loadtxt is itself written in C and is faster than
+np.fromstring, so the default backend is loadtxt there and numpy on
+older versions.
+"""
+
+import warnings
+import numpy as np
+
+
+BACKENDS = ('numpy', 'loadtxt')
+
+_NUMPY_VERSION = tuple(int(part) for part in np.__version__.split('.')[:2])
+DEFAULT_BACKEND = 'loadtxt' if _NUMPY_VERSION >= (1, 23) else 'numpy'
+
+
+def _shape_like_loadtxt(array, ndmin):
+    """
+    Objective: To give a 2-D (rows, columns) array the shape
+    np.loadtxt would have given it for the same ndmin.
+    """
+    if ndmin == 2:
+        return array
+    array = np.squeeze(array)
+    if ndmin == 1:
+        array = np.atleast_1d(array)
+    return array
+
+
+def _parse_numpy(text, ndmin):
+    """
+    Objective: To parse whitespace separated text with np.fromstring.
+    Returns None when the text needs np.loadtxt.
+    """
+    if '#' in text or '\ufeff' in text:
+        return None
+    first_line = text.lstrip().split('\n', 1)[0]
+    ncols = len(first_line.split())
+    if ncols == 0:
+        return None
+    # rows is only right if there are no blank lines, which the
+    # size check below catches
+    rows = text.count('\n') + (not text.endswith('\n'))
+    with warnings.catch_warnings():
+        # fromstring only warns when it stops at text it cannot parse
+        warnings.simplefilter('error')
+        try:
+            values = np.fromstring(text, dtype=float, sep=' ')
+        except (ValueError, DeprecationWarning):
+            return None
+    if values.size != rows * ncols:
+        return None
+    return _shape_like_loadtxt(values.reshape(rows, ncols), ndmin)
+
+
+def parse_text(text, backend=None, ndmin=0):
+    """
+    Objective: To turn whitespace separated numeric text into an array.
+
+    Parameters
+    ----------
+    text: string or list
+        The text to parse, one row per line, or the list of its lines
+        (such as those read from an open file), which np.loadtxt
+        parses without joining them.
+
+    backend: string
+        One of BACKENDS. Defaults to DEFAULT_BACKEND.
+
+    ndmin: int
+        The smallest number of dimensions of the array, as in np.loadtxt.
+
+
+    Returns
+    -------
+    array: array
+        The same float64 array np.loadtxt would give for the text.
+    """
+    if backend is None:
+        backend = DEFAULT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"backend should be one of {BACKENDS}")
+    array = None
+    if backend == 'numpy':
+        array = _parse_numpy(text if isinstance(text, str)
+                             else ''.join(text), ndmin)
+    if array is None:
+        lines = text.splitlines() if isinstance(text, str) else text
+        array = np.loadtxt(lines, dtype=float, ndmin=ndmin)
+    return array
+
+
+def read_array(file_path, backend=None, ndmin=0):
+    """
+    Objective: To load a whitespace separated numeric file as an array.
+
+    Parameters
+    ----------
+    file_path: str
+        This will provide the file path needed.
+
+    backend: string
+        One of BACKENDS. Defaults to DEFAULT_BACKEND.
+
+    ndmin: int
+        The smallest number of dimensions of the array, as in np.loadtxt.
+
+
+    Returns
+    -------
+    array: array
+        The same float64 array np.loadtxt would give for the file.
+    """
+    if backend is None:
+        backend = DEFAULT_BACKEND
+    if backend == 'loadtxt':
+        return np.loadtxt(file_path, dtype=float, ndmin=ndmin)
+    with open(file_path) as opened_file:
+        text = opened_file.read()
+    return parse_text(text, backend, ndmin)
@@ -0,0 +1,356 @@
+#!/usr/bin/python3
+"""
+Contains the functions permutation_test and bootstrap_ci, which tell
+how far the auc and peak zscore that allfunctions.statistics gives for
+a behavior are from chance.
+
+permutation_test builds a null distribution by moving the events of the
+behavior to other places in the session, either all shifted together
+around the recording ('shift') or each placed at random ('random'),
+and finding the auc and peak zscore again. bootstrap_ci resamples the
+events with replacement to give confidence intervals.
+
+The resamples are done in blocks of BATCH_SIZE as array operations,
+and the blocks are spread over a pool of processes. Each block gets its
+own random stream from one np.random.SeedSequence, so the results for
+a seed are the same for any number of processes.
+
+Windows are read around the recording as a circle, so a moved event
+keeps all of its samples. For events whose windows are all inside the
+recording, the observed values are those of allfunctions.statistics.
+"""
+
+import concurrent.futures
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+import allfunctions
+
+
+# resamples computed together in one array operation
+BATCH_SIZE = 250
+METHODS = ('shift', 'random')
+ALTERNATIVES = ('greater', 'less', 'two-sided')
+
+# the session a worker process resamples, set by _init_worker
+_worker = {}
+
+
+class _Windows:
+    """
+    The signal and the windows of one behavior: the event window
+    (timeafter samples from each start), the baseline window (from
+    timeprior samples before each stop to the start) and the auc window
+    (from each start to its stop).
+    """
+    __slots__ = ('circle', 'cumsum', 'n', 'start', 'base_first',
+                 'base_length', 'auc_length', 'timeafter')
+
+    def __init__(self, behav_start_loc, behav_stop_loc, normsig,
+                 timeafter, timeprior):
+        normsig = np.asarray(normsig, dtype=float).ravel()
+        self.n = len(normsig)
+        # two copies, so every window that starts in the first copy can
+        # be read without wrapping around. The zscores are found from the
+        # signal minus its mean, which keeps the sums of squares precise.
+        self.circle = np.concatenate([normsig, normsig])
+        self.cumsum = np.concatenate([[0.0], np.cumsum(self.circle)])
+        self.circle -= normsig.mean() if self.n else 0.0
+        self.start = np.asarray(behav_start_loc, dtype=np.int64).ravel()
+        stop = np.asarray(behav_stop_loc, dtype=np.int64).ravel()
+        # the windows have the lengths the slices in allfunctions give
+        first, last = allfunctions._slice_bounds(stop - timeprior,
+                                                 self.start, self.n)
+        self.base_first = first
+        self.base_length = last - first
+        first, last = allfunctions._slice_bounds(self.start, stop + 1,
+                                                 self.n)
+        self.auc_length = last - first
+        self.timeafter = min(timeafter, self.n)
+
+    def response(self, start, base_first, base_length, auc_length):
+        """
+        Objective: To find the auc and peak zscore of each resample as
+        allfunctions.statistics does: the pooled mean over the auc
+        windows, and the max of the mean zscore trace, where the baseline
+        mean and standard deviation are the means over lags of the
+        across-event values.
+
+        Parameters
+        ----------
+        start, base_first, base_length, auc_length: array
+            The (resamples x events) event starts, baseline starts,
+            baseline lengths and auc lengths.
+
+
+        Returns
+        -------
+        auc: array
+            The auc of each resample.
+
+        peak_z: array
+            The peak zscore of each resample.
+        """
+        start = start % self.n
+        base_first = base_first % self.n
+        resamples, events = start.shape
+        auc_sums = self.cumsum[start + auc_length] - self.cumsum[start]
+
+        # add up the windows one event at a time, for every
+        # resample at once, instead of stacking them all
+        after = sliding_window_view(self.circle, self.timeafter)
+        longest = int(base_length.max()) if base_length.size else 0
+        base = sliding_window_view(self.circle, max(longest, 1))
+        trace = np.zeros((resamples, self.timeafter))
+        sums = np.zeros((resamples, longest))
+        squares = np.zeros((resamples, longest))
+        counts = np.zeros((resamples, longest))
+        for event in range(events):
+            trace += after[start[:, event]]
+            lengths = base_length[:, event]
+            length = lengths.max() if resamples else 0
+            if length == 0:
+                continue
+            windows = base[base_first[:, event], :length]
+            if lengths.min() == length:
+                sums[:, :length] += windows
+                squares[:, :length] += windows**2
+                counts[:, :length] += 1
+            else:
+                valid = np.arange(length) < lengths[:, None]
+                windows = np.where(valid, windows, 0.0)
+                sums[:, :length] += windows
+                squares[:, :length] += windows**2
+                counts[:, :length] += valid
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            auc = auc_sums.sum(axis=1) / auc_length.sum(axis=1)
+            lag_means = sums / counts
+            has_values = counts > 0
+            base_mean = (np.where(has_values, lag_means, 0.0).sum(axis=1) /
+                         has_values.sum(axis=1))
+            lag_vars = (squares - sums * lag_means) / (counts - 1)
+            has_std = counts > 1
+            lag_stds = np.sqrt(np.maximum(np.where(has_std, lag_vars, 0.0),
+                                          0.0))
+            base_std = lag_stds.sum(axis=1) / has_std.sum(axis=1)
+            # the mean zscore trace is the zscore of the mean trace
+            peak_z = (trace.max(axis=1) / events - base_mean) / base_std
+        return auc, peak_z
+
+    def observed(self):
+        """
+        Objective: To find the auc and peak zscore of the events as they are.
+        """
+        auc, peak_z = self.response(self.start[None], self.base_first[None],
+                                    self.base_length[None],
+                                    self.auc_length[None])
+        return float(auc[0]), float(peak_z[0])
+
+
+def _init_worker(windows):
+    _worker['windows'] = windows
+
+
+def _permutation_block(seed, size, method):
+    """
+    Objective: To find the auc and peak zscore of one block of
+    resamples with the events moved.
+    """
+    windows = _worker['windows']
+    rng = np.random.default_rng(seed)
+    events = len(windows.start)
+    if method == 'shift':
+        offsets = rng.integers(0, windows.n, (size, 1))
+    else:
+        offsets = rng.integers(0, windows.n, (size, events)) - windows.start
+    return windows.response(windows.start + offsets,
+                            windows.base_first + offsets,
+                            np.broadcast_to(windows.base_length,
+                                            (size, events)),
+                            np.broadcast_to(windows.auc_length,
+                                            (size, events)))
+
+
+def _bootstrap_block(seed, size, method):
+    """
+    Objective: To find the auc and peak zscore of one block of
+    resamples of the events with replacement.
+    """
+    windows = _worker['windows']
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(windows.start), (size, len(windows.start)))
+    return windows.response(windows.start[picks],
+                            windows.base_first[picks],
+                            windows.base_length[picks],
+                            windows.auc_length[picks])
+
+
+def _run_blocks(block, windows, n_resamples, method, seed, processes,
+                batch_size):
+    """
+    Objective: To run n_resamples resamples in blocks of batch_size,
+    each with its own random stream, and join the results in order.
+    """
+    sizes = [batch_size] * (n_resamples // batch_size)
+    if n_resamples % batch_size:
+        sizes.append(n_resamples % batch_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    methods = [method] * len(sizes)
+    if processes == 1 or len(sizes) <= 1:
+        _init_worker(windows)
+        results = list(map(block, seeds, sizes, methods))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+                processes, initializer=_init_worker,
+                initargs=(windows,)) as executor:
+            results = list(executor.map(block, seeds, sizes, methods))
+    if not results:
+        return np.empty(0), np.empty(0)
+    auc, peak_z = zip(*results)
+    return np.concatenate(auc), np.concatenate(peak_z)
+
+
+def _p_value(null, observed, alternative):
+    """
+    Objective: To find the share of the null distribution at least as
+    extreme as the observed value, counting the observed value itself.
+    """
+    if alternative not in ALTERNATIVES:
+        raise ValueError(f"alternative should be one of {ALTERNATIVES}")
+    null = null[~np.isnan(null)]
+    if alternative == 'greater':
+        extreme = (null >= observed).sum()
+    elif alternative == 'less':
+        extreme = (null <= observed).sum()
+    else:
+        center = np.mean(null) if len(null) else np.nan
+        extreme = (np.abs(null - center) >= abs(observed - center)).sum()
+    return (extreme + 1) / (len(null) + 1)
+
+
+def permutation_test(behav_start_loc, behav_stop_loc, normsig,
+                     n_resamples=10000, method='shift', timeafter=300,
+                     timeprior=300, alternative='greater', seed=None,
+                     processes=1, batch_size=BATCH_SIZE):
+    """
+    Objective: To test if the auc and peak zscore of a behavior are
+    larger than when its events are put at other times in the session.
+
+    Parameters
+    ----------
+    behav_start_loc: list
+        This list of integers contains the array location
+        in norm sig for the start of a behavior event.
+
+    behav_stop_loc: list
+        This list of integers contains the array location
+        in norm sig for the stop of a behavior event.
+
+    normsig: list
+        This numpy array contains the normalized
+        fluroescent values for the green channel.
+
+    n_resamples: int
+        The number of times the events are moved.
+
+    method: str
+        'shift' moves all events by the same random amount around the
+        recording, keeping the times between them. 'random' places each
+        event at its own random time. Events keep their length.
+
+    timeafter: int
+        The number of samples after the start of each event to zscore.
+
+    timeprior: int
+        The number of samples in the baseline before each event.
+
+    alternative: str
+        'greater', 'less' or 'two-sided', the side the p values are for.
+
+    seed: int
+        The seed the random streams of the blocks are spawned from.
+
+    processes: int
+        The number of worker processes. None uses one per CPU.
+
+    batch_size: int
+        The number of resamples in each block.
+
+
+    Returns
+    -------
+    result: dict
+        This dict holds the observed 'auc' and 'peak_z', their null
+        distributions 'null_auc' and 'null_peak_z', and the p values
+        'p_auc' and 'p_peak_z'.
+    """
+    if method not in METHODS:
+        raise ValueError(f"method should be one of {METHODS}")
+    windows = _Windows(behav_start_loc, behav_stop_loc, normsig,
+                       timeafter, timeprior)
+    auc, peak_z = windows.observed()
+    null_auc, null_peak_z = _run_blocks(_permutation_block, windows,
+                                        n_resamples, method, seed,
+                                        processes, batch_size)
+    return {'auc': auc, 'peak_z': peak_z,
+            'null_auc': null_auc, 'null_peak_z': null_peak_z,
+            'p_auc': _p_value(null_auc, auc, alternative),
+            'p_peak_z': _p_value(null_peak_z, peak_z, alternative)}
+
+
+def bootstrap_ci(behav_start_loc, behav_stop_loc, normsig,
+                 n_resamples=10000, confidence=0.95, timeafter=300,
+                 timeprior=300, seed=None, processes=1,
+                 batch_size=BATCH_SIZE):
+    """
+    Objective: To find confidence intervals for the auc and peak zscore
+    of a behavior by resampling its events with replacement.
+
+    Parameters
+    ----------
+    behav_start_loc: list
+        This list of integers contains the array location
+        in norm sig for the start of a behavior event.
+
+    behav_stop_loc: list
+        This list of integers contains the array location
+        in norm sig for the stop of a behavior event.
+
+    normsig: list
+        This numpy array contains the normalized
+        fluroescent values for the green channel.
+
+    n_resamples: int
+        The number of bootstrap resamples.
+
+    confidence: float
+        The share of the bootstrap distribution inside the intervals.
+
+    seed, processes, batch_size:
+        As in permutation_test.
+
+
+    Returns
+    -------
+    result: dict
+        This dict holds the observed 'auc' and 'peak_z', their bootstrap
+        distributions 'boot_auc' and 'boot_peak_z', and percentile
+        intervals 'ci_auc' and 'ci_peak_z' as (low, high).
+    """
+    windows = _Windows(behav_start_loc, behav_stop_loc, normsig,
+                       timeafter, timeprior)
+    auc, peak_z = windows.observed()
+    boot_auc, boot_peak_z = _run_blocks(_bootstrap_block, windows,
+                                        n_resamples, None, seed,
+                                        processes, batch_size)
+    tails = [(1 - confidence) / 2 * 100, (1 + confidence) / 2 * 100]
+
+    def interval(values):
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return (np.nan, np.nan)
+        return tuple(float(value) for value in np.percentile(values, tails))
+
+    return {'auc': auc, 'peak_z': peak_z,
+            'boot_auc': boot_auc, 'boot_peak_z': boot_peak_z,
+            'ci_auc': interval(boot_auc), 'ci_peak_z': interval(boot_peak_z)}
@@ -0,0 +1,311 @@
+#!/usr/bin/python3
+"""
+Contains the ResultsWriter class, which collects result rows (such as
+the auc and peak zscore of each session and behavior) in one list per
+column and writes them all at once to a CSV file with a header, or a
+Parquet file if pyarrow is installed.
+
+Files are written to a temporary file and renamed over the old one, so
+a results file is never seen half written. When several processes make
+results, each writes its own file (see worker_path) and merge_results
+joins them at the end.
+"""
+
+import os
+import csv
+import glob
+import math
+import tempfile
+import numpy as np
+
+
+# (name, type) of the columns of the summary of each session and behavior
+SUMMARY_COLUMNS = (('session', str), ('animal', str), ('behavior', str),
+                   ('n_events', int), ('auc', float), ('peak_z', float),
+                   ('latency_s', float), ('onset_latency_s', float),
+                   ('area', float), ('decay_half_time_s', float))
+
+# (name, type) of the columns of the metrics of each event
+EVENT_COLUMNS = (('session', str), ('animal', str), ('behavior', str),
+                 ('event', int), ('peak_z', float), ('time_to_peak_s', float),
+                 ('onset_latency_s', float), ('area', float),
+                 ('decay_half_time_s', float))
+
+FORMATS = ('csv', 'parquet')
+
+
+def _format_of(path, file_format):
+    if file_format is None:
+        file_format = 'parquet' if path.endswith('.parquet') else 'csv'
+    if file_format not in FORMATS:
+        raise ValueError(f"file_format should be one of {FORMATS}")
+    return file_format
+
+
+def _convert(value, kind):
+    """
+    Objective: To turn a value into the type of its column.
+    Missing values are '' for text, -1 for integers and nan for floats.
+    """
+    if value is None or value == '':
+        return {str: '', int: -1, float: math.nan}[kind]
+    return kind(value)
+
+
+def summary_row(result, behavior, session='', animal=''):
+    """
+    Objective: To give the SUMMARY_COLUMNS row of an
+    allfunctions.behavior_statistics result.
+    """
+    trace = result.get('trace', {})
+    return {'session': session, 'animal': animal, 'behavior': behavior,
+            'n_events': result['n_events'], 'auc': result['auc'],
+            'peak_z': result['max_zscore'], 'latency_s': result['idx_sec'],
+            'onset_latency_s': trace.get('onset_latency'),
+            'area': trace.get('area'),
+            'decay_half_time_s': trace.get('decay_half_time')}
+
+
+def event_rows(result, behavior, session='', animal=''):
+    """
+    Objective: To give the EVENT_COLUMNS rows of an
+    allfunctions.behavior_statistics result, one sequence per column,
+    for ResultsWriter.extend.
+    """
+    events = result['events']
+    return {'session': session, 'animal': animal, 'behavior': behavior,
+            'event': range(len(events['peak'])), 'peak_z': events['peak'],
+            'time_to_peak_s': events['time_to_peak'],
+            'onset_latency_s': events['onset_latency'],
+            'area': events['area'],
+            'decay_half_time_s': events['decay_half_time']}
+
+
+def worker_path(path, worker=None):
+    """
+    Objective: To give the results file of one worker process,
+    such as results.worker-1234.csv for results.csv.
+
+    Parameters
+    ----------
+    path: string
+        The file path of the merged results.
+
+    worker: int or string
+        The name of the worker. Defaults to the process id.
+    """
+    if worker is None:
+        worker = os.getpid()
+    root, extension = os.path.splitext(path)
+    return f"{root}.worker-{worker}{extension}"
+
+
+def _write_atomic(path, columns, kinds, file_format):
+    """
+    Objective: To write the columns to a temporary file next to path
+    and rename it to path.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    descriptor, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=directory)
+    try:
+        if file_format == 'parquet':
+            os.close(descriptor)
+            import pyarrow
+            import pyarrow.parquet
+            types = {str: pyarrow.string(), int: pyarrow.int64(),
+                     float: pyarrow.float64()}
+            table = pyarrow.table({name: pyarrow.array(values,
+                                                       types[kinds[name]])
+                                   for name, values in columns.items()})
+            pyarrow.parquet.write_table(table, tmp_path)
+        else:
+            with os.fdopen(descriptor, 'w', newline='') as opened_file:
+                writer = csv.writer(opened_file)
+                writer.writerow(list(columns))
+                writer.writerows(zip(*columns.values()))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def read_results(path, columns=SUMMARY_COLUMNS):
+    """
+    Objective: To read a results file written by ResultsWriter.
+
+    Parameters
+    ----------
+    path: string
+        The file path of a CSV or Parquet results file.
+
+    columns: tuple
+        The (name, type) of the columns, used to type the CSV values.
+        Columns not listed are read as text.
+
+
+    Returns
+    -------
+    table: dict
+        This dict holds a numpy array for each column.
+    """
+    kinds = dict(columns)
+    if _format_of(path, None) == 'parquet':
+        import pyarrow.parquet
+        table = pyarrow.parquet.read_table(path)
+        return {name: table.column(name).to_numpy(zero_copy_only=False)
+                for name in table.column_names}
+    with open(path, newline='') as opened_file:
+        reader = csv.reader(opened_file)
+        header = next(reader, [])
+        rows = list(reader)
+    table = {}
+    for number, name in enumerate(header):
+        kind = kinds.get(name, str)
+        values = [_convert(row[number], kind) for row in rows]
+        table[name] = np.array(values, dtype=kind if kind is not str
+                               else object)
+    return table
+
+
+class ResultsWriter:
+    """
+    Collects result rows in one list per column and writes them in bulk.
+    Use it as a context manager, or call close, to write the rows. A
+    context manager left by an exception writes nothing.
+
+    Parameters
+    ----------
+    path: string
+        The file path to write. A '.parquet' path is written as Parquet,
+        anything else as CSV.
+
+    columns: tuple
+        The (name, type) of each column, such as SUMMARY_COLUMNS.
+
+    file_format: string
+        'csv' or 'parquet', to use instead of the path's extension.
+    """
+    __slots__ = ('path', 'kinds', 'columns', 'file_format')
+
+    def __init__(self, path, columns=SUMMARY_COLUMNS, file_format=None):
+        self.path = path
+        self.kinds = dict(columns)
+        self.columns = {name: [] for name, _ in columns}
+        self.file_format = _format_of(path, file_format)
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()), []))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.close()
+        else:
+            # leave the file as it was rather than write partial rows
+            self.discard()
+
+    def append(self, row=None, **values):
+        """
+        Objective: To add one row. Values can be given as a dict or as
+        keywords; columns without a value are left missing.
+        """
+        if row is not None:
+            values = {**row, **values}
+        unknown = set(values) - set(self.columns)
+        if unknown:
+            raise KeyError(f"unknown columns {sorted(unknown)}")
+        for name, buffer in self.columns.items():
+            buffer.append(_convert(values.get(name), self.kinds[name]))
+
+    def extend(self, rows=None, **columns):
+        """
+        Objective: To add many rows at once, given as a list of dicts or
+        as one sequence per column. Columns given as a single value are
+        repeated for every row.
+        """
+        if rows is not None:
+            for row in rows:
+                self.append(row)
+            return
+        lengths = {len(values) for values in columns.values()
+                   if not isinstance(values, (str, int, float))}
+        if len(lengths) > 1:
+            raise ValueError("columns should all be the same length")
+        unknown = set(columns) - set(self.columns)
+        if unknown:
+            raise KeyError(f"unknown columns {sorted(unknown)}")
+        count = lengths.pop() if lengths else 1
+        for name, buffer in self.columns.items():
+            kind = self.kinds[name]
+            values = columns.get(name)
+            if values is None or isinstance(values, (str, int, float)):
+                buffer.extend([_convert(values, kind)] * count)
+            else:
+                buffer.extend([_convert(value, kind) for value in values])
+
+    def flush(self):
+        """
+        Objective: To write every row collected so far to path,
+        replacing the file in one step.
+        """
+        _write_atomic(self.path, self.columns, self.kinds, self.file_format)
+
+    def close(self):
+        """
+        Objective: To write the rows to path.
+        """
+        self.flush()
+
+    def discard(self):
+        """
+        Objective: To drop every row collected so far without writing.
+        """
+        for buffer in self.columns.values():
+            buffer.clear()
+
+
+def merge_results(path, sources=None, columns=SUMMARY_COLUMNS,
+                  remove=True):
+    """
+    Objective: To join the results files of several workers into one.
+
+    Parameters
+    ----------
+    path: string
+        The file path of the merged results.
+
+    sources: list
+        The worker files to join. Defaults to every worker_path of path.
+
+    columns: tuple
+        The (name, type) of the columns.
+
+    remove: bool
+        If True, the worker files are removed once they are merged.
+
+
+    Returns
+    -------
+    rows: int
+        The number of rows in the merged file.
+    """
+    if sources is None:
+        sources = sorted(glob.glob(worker_path(glob.escape(path), '*')))
+    writer = ResultsWriter(path, columns)
+    for source in sources:
+        table = read_results(source, columns)
+        for name, buffer in writer.columns.items():
+            if name in table:
+                buffer.extend(table[name].tolist())
+            else:
+                buffer.extend([_convert(None, writer.kinds[name])] *
+                              len(next(iter(table.values()), [])))
+    writer.flush()
+    if remove:
+        for source in sources:
+            os.remove(source)
+    return len(writer)
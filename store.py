@@ -0,0 +1,261 @@
+#!/usr/bin/python3
+"""
+Contains the SessionStore class, a columnar on-disk store for many
+parsed sessions. Each channel from parsing.file_reader is split into
+compressed chunks so a reader only loads the channels and the time
+ranges it asks for. Behavior events and session metadata are stored
+next to the channels.
+
+The layout of the store directory is
+
+    <root>/<session>/meta.json
+    <root>/<session>/channels/<channel>/<chunk number>.npz
+    <root>/<session>/events/<behavior>.npz
+"""
+
+import os
+import json
+import shutil
+import numpy as np
+
+
+# number of samples in each stored chunk
+CHUNKSIZE = 65536
+
+# channel name prefix of each animal in parsed_data
+ANIMALS = {'subject': 'f1', 'partner': 'f2', 'novel': 'f2'}
+
+# timestamp channel of each fluorescence channel
+TIME_CHANNELS = {'red': 'fTimeRed',
+                 'isosbestic': 'fTimeIsosbestic',
+                 'green': 'fTimeGreen'}
+
+
+def _time_channel(name):
+    """
+    Objective: To give the timestamp channel for a channel name.
+    """
+    for color, time_name in TIME_CHANNELS.items():
+        if name.endswith(color) or name == time_name:
+            return time_name
+    raise KeyError(name)
+
+
+class SessionStore:
+    """
+    A directory of parsed sessions stored as compressed chunked columns.
+
+    Parameters
+    ----------
+    root: string
+        The path of the store directory. It is created if needed.
+
+    chunksize: int
+        The number of samples in each stored chunk.
+    """
+
+    def __init__(self, root, chunksize=CHUNKSIZE):
+        self.root = root
+        self.chunksize = chunksize
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, session_id, *parts):
+        return os.path.join(self.root, session_id, *parts)
+
+    def sessions(self):
+        """
+        Objective: To list the sessions in the store.
+        """
+        return sorted(name for name in os.listdir(self.root)
+                      if os.path.isfile(self._path(name, 'meta.json')))
+
+    def metadata(self, session_id):
+        """
+        Objective: To give the metadata stored with a session.
+        """
+        with open(self._path(session_id, 'meta.json')) as opened_file:
+            return json.load(opened_file)
+
+    def write_session(self, session_id, parsed_data, events=None,
+                      metadata=None):
+        """
+        Objective: To store the channels of a parsed session, replacing
+        any session already stored with the same session_id.
+
+        Parameters
+        ----------
+        session_id: string
+            The name of the session in the store.
+
+        parsed_data: Session or dict
+            The channels returned by parsing.file_reader.
+
+        events: dict
+            This dict holds (start, stop) arrays for each behavior.
+
+        metadata: dict
+            Any extra information about the session, for example
+            the animal ids. It must be JSON serializable.
+        """
+        shutil.rmtree(self._path(session_id), ignore_errors=True)
+        channels = {}
+        for name in parsed_data.keys():
+            array = np.asarray(parsed_data[name])
+            ftime = np.asarray(parsed_data[_time_channel(name)])
+            directory = self._path(session_id, 'channels', name)
+            os.makedirs(directory)
+            chunks = []
+            for number, start in enumerate(range(0, len(array),
+                                                 self.chunksize)):
+                stop = min(start + self.chunksize, len(array))
+                np.savez_compressed(os.path.join(directory, f"{number:05d}"),
+                                    array=array[start:stop])
+                chunks.append([float(ftime[start]), float(ftime[stop-1]),
+                               stop - start])
+            channels[name] = chunks
+        meta = {'channels': channels, 'metadata': metadata or {}}
+        with open(self._path(session_id, 'meta.json'), 'w') as opened_file:
+            json.dump(meta, opened_file)
+        if events:
+            self.write_events(session_id, events)
+
+    def write_events(self, session_id, events):
+        """
+        Objective: To store the behavior events of a session.
+
+        Parameters
+        ----------
+        session_id: string
+            The name of the session in the store.
+
+        events: dict
+            This dict holds (start, stop) arrays for each behavior.
+        """
+        directory = self._path(session_id, 'events')
+        os.makedirs(directory, exist_ok=True)
+        for behavior, (start, stop) in events.items():
+            np.savez_compressed(os.path.join(directory, behavior),
+                                start=start, stop=stop)
+
+    def read_events(self, session_id, behavior=None):
+        """
+        Objective: To read the behavior events of a session.
+
+        Parameters
+        ----------
+        session_id: string
+            The name of the session in the store.
+
+        behavior: string
+            The behavior to read. If None, all behaviors are read.
+
+
+        Returns
+        -------
+        events: dict
+            This dict holds (start, stop) arrays for each behavior.
+        """
+        directory = self._path(session_id, 'events')
+        if behavior is None:
+            if not os.path.isdir(directory):
+                return {}
+            behaviors = sorted(name[:-4] for name in os.listdir(directory))
+        else:
+            behaviors = [behavior]
+        events = {}
+        for name in behaviors:
+            with np.load(os.path.join(directory, name + '.npz')) as stored:
+                events[name] = (stored['start'], stored['stop'])
+        return events
+
+    def read_channel(self, session_id, name, t_start=None, t_stop=None):
+        """
+        Objective: To read one channel of a session, loading only the
+        chunks that overlap the time range.
+
+        Parameters
+        ----------
+        session_id: string
+            The name of the session in the store.
+
+        name: string
+            The channel name, for example 'f1green'.
+
+        t_start: float
+            The first timestamp to read. Defaults to the start.
+
+        t_stop: float
+            The last timestamp to read. Defaults to the end.
+
+
+        Returns
+        -------
+        array: array
+            The channel values with timestamps in [t_start, t_stop].
+        """
+        chunks = self.metadata(session_id)['channels'][name]
+        ftime_chunks = None
+        if t_start is not None or t_stop is not None:
+            ftime_chunks = self._read_chunks(session_id, _time_channel(name),
+                                             chunks, t_start, t_stop)
+        pieces = self._read_chunks(session_id, name, chunks, t_start, t_stop)
+        if not pieces:
+            return np.empty(0)
+        array = np.concatenate(pieces)
+        if ftime_chunks is not None:
+            ftime = np.concatenate(ftime_chunks)
+            lo = 0 if t_start is None else np.searchsorted(ftime, t_start)
+            hi = (len(ftime) if t_stop is None
+                  else np.searchsorted(ftime, t_stop, side='right'))
+            array = array[lo:hi]
+        return array
+
+    def _read_chunks(self, session_id, name, chunks, t_start, t_stop):
+        directory = self._path(session_id, 'channels', name)
+        pieces = []
+        for number, (first, last, _) in enumerate(chunks):
+            if t_start is not None and last < t_start:
+                continue
+            if t_stop is not None and first > t_stop:
+                break
+            path = os.path.join(directory, f"{number:05d}.npz")
+            with np.load(path) as stored:
+                pieces.append(stored['array'])
+        return pieces
+
+    def read(self, session_id, animal, color, t_start=None, t_stop=None):
+        """
+        Objective: To read the timestamps and fluorescence of
+        one channel of one animal in a time range.
+
+        Parameters
+        ----------
+        session_id: string
+            The name of the session in the store.
+
+        animal: string
+            One of the keys of ANIMALS, as in the [ANIMALS] config section.
+
+        color: string
+            'red', 'isosbestic' or 'green'.
+
+        t_start: float
+            The first timestamp to read. Defaults to the start.
+
+        t_stop: float
+            The last timestamp to read. Defaults to the end.
+
+
+        Returns
+        -------
+        ftime: array
+            The timestamps of the samples.
+
+        fluor: array
+            The fluorescence of the samples.
+        """
+        ftime = self.read_channel(session_id, TIME_CHANNELS[color],
+                                  t_start, t_stop)
+        fluor = self.read_channel(session_id, ANIMALS[animal] + color,
+                                  t_start, t_stop)
+        return ftime, fluor
@@ -0,0 +1,202 @@
+#!/usr/bin/python3
+"""
+Tests for the event alignment and statistics in allfunctions, checked
+against the original argmin loops and list and pandas code on the files
+bundled in correct_func_test_data and on ragged and empty windows.
+Run them with
+
+    python -m pytest test_*.py
+"""
+
+import os
+import numpy as np
+import pytest
+import allfunctions
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'correct_func_test_data')
+
+
+def argmin_nearest_loc(fluor_array, behav_array):
+    """
+    Objective: The original behavior_nearest_loc loop.
+    """
+    return [np.abs(fluor_array - x).argmin() for x in np.nditer(behav_array)]
+
+
+@pytest.fixture(scope='module')
+def fluor_array():
+    return allfunctions.file2numpy(os.path.join(DATA_DIR, 'fTimeGreen.txt'))
+
+
+@pytest.mark.parametrize('name', ['push_start_time.txt',
+                                  'push_stop_time.txt'])
+def test_nearest_index_push_events(fluor_array, name):
+    behav_array = allfunctions.file2numpy(os.path.join(DATA_DIR, name))
+    expected = argmin_nearest_loc(fluor_array, behav_array)
+    assert np.array_equal(allfunctions.nearest_index(fluor_array,
+                                                     behav_array), expected)
+    alignment = allfunctions.align_events(fluor_array, behav_array,
+                                          behav_array)
+    assert np.array_equal(alignment['start_loc'], expected)
+    assert np.array_equal(alignment['start_time'], fluor_array[expected])
+
+
+def test_nearest_index_ties(fluor_array):
+    # exact time points, midpoints and events outside the recording
+    behav_array = np.concatenate([
+        fluor_array[:100], (fluor_array[:100] + fluor_array[1:101]) / 2,
+        [fluor_array[0] - 1000, fluor_array[-1] + 1000]])
+    assert np.array_equal(allfunctions.nearest_index(fluor_array,
+                                                     behav_array),
+                          argmin_nearest_loc(fluor_array, behav_array))
+
+
+def test_nearest_index_repeated_time_points():
+    fluor_array = np.array([0.0, 10.0, 10.0, 10.0, 20.0, 30.0])
+    behav_array = np.array([-5.0, 5.0, 9.0, 10.0, 11.0, 15.0, 25.0, 35.0])
+    assert np.array_equal(allfunctions.nearest_index(fluor_array,
+                                                     behav_array),
+                          argmin_nearest_loc(fluor_array, behav_array))
+
+
+# the original list and pandas versions of the statistics functions
+def legacy_area_under_curve(behav_start_loc, behav_stop_loc, normsig):
+    total_len, total_sum = 0, 0
+    for x, y in zip(behav_start_loc, [x+1 for x in behav_stop_loc]):
+        total_sum += sum(normsig[x:y])
+        total_len += len(normsig[x:y])
+    return total_sum / total_len
+
+
+def legacy_windows(normsig, x, y):
+    return [normsig[start:stop] for start, stop in zip(x, y)]
+
+
+def legacy_base_mean(baseline_fluor):
+    pd = pytest.importorskip('pandas')
+    baseline_mean = pd.DataFrame(baseline_fluor).mean()
+    return sum(baseline_mean)/len(baseline_mean)
+
+
+def legacy_baselinestd(baseline_fluor):
+    pd = pytest.importorskip('pandas')
+    return pd.DataFrame(baseline_fluor).std().mean()
+
+
+def legacy_zscore_max(event_zscores):
+    pd = pytest.importorskip('pandas')
+    row_means = pd.DataFrame(event_zscores).mean(axis=0).to_list()
+    max_zscore = max(row_means)
+    return max_zscore, row_means.index(max_zscore)/60
+
+
+def legacy_frame(windows):
+    pd = pytest.importorskip('pandas')
+    return pd.DataFrame(windows).to_numpy(dtype=float)
+
+
+@pytest.fixture(scope='module')
+def push(fluor_array):
+    normsig = allfunctions.file2numpy(os.path.join(DATA_DIR,
+                                                   'sages2ndFit1.txt'))
+    start_loc, stop_loc = (
+        allfunctions.nearest_index(fluor_array, allfunctions.file2numpy(
+            os.path.join(DATA_DIR, name)))
+        for name in ('push_start_time.txt', 'push_stop_time.txt'))
+    return normsig, list(start_loc), list(stop_loc)
+
+
+def ragged():
+    """
+    Objective: To give a short signal and windows that run off both
+    ends of it, start at negative locations, are empty or are reversed.
+    """
+    normsig = np.random.default_rng(1).normal(1, 0.1, 50)
+    x = [-7, -60, 0, 10, 20, 30, 45, 49, 12]
+    y = [3, 5, 8, 10, 35, 26, 60, 50, 40]
+    return normsig, x, y
+
+
+def test_statistics_match_legacy_on_push(push):
+    normsig, start_loc, stop_loc = push
+    assert np.isclose(allfunctions.area_under_curve(start_loc, stop_loc,
+                                                    normsig),
+                      legacy_area_under_curve(start_loc, stop_loc, normsig),
+                      rtol=1e-13)
+
+    event_fluor = legacy_windows(normsig, start_loc,
+                                 [x+300 for x in start_loc])
+    epoch_fluor, _ = allfunctions.epochs(normsig, start_loc, 0, 300)
+    assert np.array_equal(epoch_fluor, legacy_frame(event_fluor),
+                          equal_nan=True)
+
+    baseline = legacy_windows(normsig, [x-300 for x in stop_loc], start_loc)
+    window_fluor, _ = allfunctions.window_matrix(
+        normsig, np.asarray(stop_loc) - 300, start_loc)
+    assert np.array_equal(window_fluor, legacy_frame(baseline),
+                          equal_nan=True)
+
+    for windows in (baseline, window_fluor):
+        assert np.isclose(allfunctions.base_mean(windows),
+                          legacy_base_mean(baseline), rtol=1e-13)
+        assert np.isclose(allfunctions.baselinestd(windows),
+                          legacy_baselinestd(baseline), rtol=1e-13)
+
+    mean = legacy_base_mean(baseline)
+    std = legacy_baselinestd(baseline)
+    zscores = [(x - mean) / std for x in event_fluor]
+    expected = legacy_zscore_max(zscores)
+    for event_zscores in (zscores, allfunctions.event_z(epoch_fluor, mean,
+                                                        std)):
+        max_zscore, idx_sec = allfunctions.zscore_max(event_zscores)
+        assert np.isclose(max_zscore, expected[0], rtol=1e-13)
+        assert idx_sec == expected[1]
+
+
+def test_statistics_match_legacy_on_ragged_windows():
+    normsig, x, y = ragged()
+    windows = legacy_windows(normsig, x, y)
+    window_fluor, valid = allfunctions.window_matrix(normsig, x, y)
+    assert np.array_equal(window_fluor, legacy_frame(windows),
+                          equal_nan=True)
+    assert np.array_equal(valid, ~np.isnan(legacy_frame(windows)))
+
+    assert np.isclose(allfunctions.area_under_curve(x, y, normsig),
+                      legacy_area_under_curve(x, y, normsig), rtol=1e-13)
+    for function, legacy in ((allfunctions.base_mean, legacy_base_mean),
+                             (allfunctions.baselinestd, legacy_baselinestd),
+                             (allfunctions.zscore_max, legacy_zscore_max)):
+        for given in (windows, window_fluor):
+            assert np.allclose(function(given), legacy(windows),
+                               rtol=1e-13, equal_nan=True)
+
+    # epochs pads with nan at both ends, so each column is the same lag
+    epoch_fluor, valid = allfunctions.epochs(normsig, [0, 3, 45], 5, 10)
+    expected = np.full((3, 15), np.nan)
+    for row, loc in enumerate([0, 3, 45]):
+        for column, position in enumerate(range(loc - 5, loc + 10)):
+            if 0 <= position < len(normsig):
+                expected[row, column] = normsig[position]
+    assert np.array_equal(epoch_fluor, expected, equal_nan=True)
+    assert np.array_equal(valid, ~np.isnan(expected))
+
+
+def test_statistics_of_empty_windows():
+    normsig, _, _ = ragged()
+    # pandas gives nan for the std; the legacy mean and zscore_max
+    # raised, and return nan instead
+    windows = legacy_windows(normsig, [10, 20], [10, 5])
+    window_fluor, _ = allfunctions.window_matrix(normsig, [10, 20], [10, 5])
+    assert window_fluor.shape == (2, 0)
+    assert np.isnan(legacy_baselinestd(windows))
+    for given in (windows, window_fluor):
+        assert np.isnan(allfunctions.base_mean(given))
+        assert np.isnan(allfunctions.baselinestd(given))
+        max_zscore, idx_sec = allfunctions.zscore_max(given)
+        assert np.isnan(max_zscore) and idx_sec == 0.0
+    assert np.isnan(allfunctions.area_under_curve([10, 20], [8, 5],
+                                                  normsig))
+    epoch_fluor, valid = allfunctions.epochs(normsig, [], 0, 300)
+    assert epoch_fluor.shape == (0, 300) and valid.shape == (0, 300)
@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+"""
+Tests for follow.ChannelBuffer and follow.FollowReader, which is
+checked against file_reader while follow.replay writes a recording
+from another process. Run them with
+
+    python -m pytest test_*.py
+"""
+
+import multiprocessing
+import numpy as np
+import pytest
+import benchmark
+import follow
+import parsing
+
+
+def assert_matches_file_reader(session, path):
+    # FollowReader keeps the last rows that file_reader drops
+    expected = parsing.file_reader(path, use_cache=False)
+    for name in parsing.CHANNEL_NAMES:
+        count = len(expected[name])
+        assert np.array_equal(session[name][:count], expected[name])
+
+
+@pytest.mark.parametrize('capacity', [None, 1, 7, 100])
+@pytest.mark.parametrize('sizes', [[1] * 50, [3, 5, 20, 1, 9, 40],
+                                   [250], [0, 6, 0, 6]])
+def test_channel_buffer_keeps_newest_samples(capacity, sizes):
+    buffer = follow.ChannelBuffer(capacity, size=4)
+    appended = []
+    values = iter(np.arange(sum(sizes), dtype=float))
+    for size in sizes:
+        chunk = [next(values) for _ in range(size)]
+        buffer.append(chunk)
+        appended.extend(chunk)
+        expected = appended if capacity is None else appended[-capacity:]
+        assert len(buffer) == len(expected)
+        assert np.array_equal(buffer.array(), expected)
+    if capacity is not None:
+        assert len(buffer.data) <= capacity
+
+
+def test_follow_reader_matches_file_reader(tmp_path):
+    path = tmp_path / 'raw.csv'
+    source = tmp_path / 'recording.csv'
+    benchmark.synthetic_raw(source, 400)
+    text = source.read_text()
+    reader = follow.FollowReader(path)
+    # write the file in pieces that cut lines in half
+    for start in range(0, len(text), 997):
+        with open(path, 'a') as opened_file:
+            opened_file.write(text[start:start+997])
+        reader.poll()
+    assert reader.rows == 400
+    assert_matches_file_reader(reader.session(), source)
+
+
+def test_follow_replay_from_another_process(tmp_path):
+    source = tmp_path / 'recording.csv'
+    live = tmp_path / 'live.csv'
+    rows = 600
+    benchmark.synthetic_raw(source, rows)
+    # 15 s of recording replayed in about 0.05 s
+    writer = multiprocessing.Process(target=follow.replay,
+                                     args=(source, live, 300.0))
+    writer.start()
+    reader = follow.FollowReader(live, poll_interval=0.005)
+    reader.follow(idle_timeout=10, stop=lambda: (not writer.is_alive() and
+                                                 reader.rows == rows))
+    writer.join()
+    assert writer.exitcode == 0
+    assert reader.rows == rows
+    assert_matches_file_reader(reader.session(), source)
@@ -0,0 +1,121 @@
+#!/usr/bin/python3
+"""
+Tests for memo.memoize on the analysis functions of allfunctions, run
+with pipeline.session_statistics on the files bundled in
+correct_func_test_data and correct_test_data. Run them with
+
+    python -m pytest test_*.py
+"""
+
+import os
+import numpy as np
+import pytest
+import allfunctions
+import boris
+import memo
+import pipeline
+import timebase
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+FUNC_DATA_DIR = os.path.join(ROOT, 'correct_func_test_data')
+DATA_DIR = os.path.join(ROOT, 'correct_test_data')
+
+
+@pytest.fixture(autouse=True)
+def memoized():
+    memo.clear()
+    memo.enable()
+    yield
+    memo.disable()
+    memo.clear()
+
+
+@pytest.fixture
+def session():
+    return pipeline.load_session(
+        None, [os.path.join(DATA_DIR, name)
+               for name in ('push.csv', 'rear.csv')],
+        fluor_array=os.path.join(FUNC_DATA_DIR, 'fTimeGreen.txt'),
+        normsig=os.path.join(FUNC_DATA_DIR, 'sages2ndFit1.txt'))
+
+
+def test_unchanged_inputs_hit(session):
+    first = pipeline.session_statistics(session)
+    misses = memo.stats()['misses']
+    second = pipeline.session_statistics(session)
+    assert memo.stats()['misses'] == misses
+    assert memo.stats()['hits'] > 0
+    for behavior in first:
+        assert second[behavior] is first[behavior]
+
+
+def test_changed_behavior_times_miss(session):
+    first = pipeline.session_statistics(session)
+    events = session['events']
+    rear = events._slice('rear')
+    start = events.start.copy()
+    start[rear] += 1000
+    session['events'] = boris.BehaviorEvents(events.behaviors,
+                                             events.offsets, start,
+                                             events.stop)
+    misses = memo.stats()['misses']
+    second = pipeline.session_statistics(session)
+    assert memo.stats()['misses'] > misses
+    # push has the same times and alignment, so its result is kept
+    assert second['push'] is first['push']
+    assert second['rear'] is not first['rear']
+    assert second['rear']['auc'] != first['rear']['auc']
+
+
+def test_replaced_function_misses(session, monkeypatch):
+    first = pipeline.session_statistics(session)
+    baselinestd = allfunctions.baselinestd
+    monkeypatch.setattr(allfunctions, 'baselinestd',
+                        lambda baseline_fluor: 2 * baselinestd(baseline_fluor))
+    second = pipeline.session_statistics(session)
+    for behavior in first:
+        assert np.isclose(second[behavior]['max_zscore'],
+                          first[behavior]['max_zscore'] / 2)
+
+    # a method of an argument's class is part of the key too
+    index = timebase.Timebase.index
+    calls = []
+
+    def counted_index(self, times, flag_outside=False):
+        calls.append(len(times))
+        return index(self, times, flag_outside)
+    monkeypatch.setattr(timebase.Timebase, 'index', counted_index)
+    pipeline.session_statistics(session)
+    assert calls
+
+    monkeypatch.undo()
+    misses = memo.stats()['misses']
+    third = pipeline.session_statistics(session)
+    assert memo.stats()['misses'] == misses
+    for behavior in first:
+        assert third[behavior] is first[behavior]
+
+
+def directory_bytes(directory):
+    return sum(os.path.getsize(os.path.join(path, name))
+               for path, _, names in os.walk(directory) for name in names)
+
+
+def test_disk_cache_stays_under_max_bytes(tmp_path):
+    cache_dir = tmp_path / 'memo'
+    max_bytes = 4 * 1024
+    memo.enable(str(cache_dir), max_bytes=max_bytes)
+    windows = [np.random.default_rng(seed).normal(1, 0.1, (5, 300))
+               for seed in range(100)]
+    expected = [allfunctions.base_mean(window) for window in windows]
+    assert memo.stats()['misses'] == 100
+    assert 0 < directory_bytes(cache_dir) <= max_bytes
+    assert len(os.listdir(cache_dir)) < 100
+
+    # the newest results are read back from disk, the oldest are gone
+    memo.clear()
+    assert allfunctions.base_mean(windows[-1]) == expected[-1]
+    assert memo.stats()['disk_hits'] == 1
+    assert allfunctions.base_mean(windows[0]) == expected[0]
+    assert memo.stats()['misses'] == 1
@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+"""
+Tests for parsing.file_reader, run on small raw data files written
+like a FiberPhoSig recording by benchmark.synthetic_data. Run them with
+
+    python -m pytest test_*.py
+"""
+
+import numpy as np
+import pytest
+import parsing
+from benchmark import synthetic_data, write_raw
+
+
+@pytest.mark.parametrize('rows', [1, 2, 3, 23, 24, 25, 26, 27, 28, 29, 30,
+                                  31, 50, 100])
+@pytest.mark.parametrize('chunksize', [1, 2, 3, 7])
+def test_chunks_match_whole_file(tmp_path, rows, chunksize):
+    path = tmp_path / 'raw.csv'
+    write_raw(path, synthetic_data(rows))
+    whole = parsing.file_reader(path, use_cache=False)
+    chunked = parsing.file_reader(path, use_cache=False, chunksize=chunksize)
+    pieces = list(parsing.iter_file_chunks(path, chunksize))
+    for name in parsing.CHANNEL_NAMES:
+        assert np.array_equal(chunked[name], whole[name])
+        assert np.array_equal(np.concatenate([piece[name]
+                                              for piece in pieces]),
+                              whole[name])
+
+
+@pytest.mark.parametrize('rows', [30, 31, 32, 300])
+@pytest.mark.parametrize('flags', [True, False])
+def test_auto_phase_matches_config_on_clean_file(tmp_path, rows, flags):
+    data = synthetic_data(rows)
+    if not flags:
+        data[:, parsing.LED_COLUMN] = 0
+    path = tmp_path / 'raw.csv'
+    write_raw(path, data)
+    config = parsing.file_reader(path, use_cache=False)
+    auto = parsing.file_reader(path, use_cache=False, phase='auto')
+    for name in parsing.CHANNEL_NAMES:
+        assert np.array_equal(auto[name], config[name])
+
+
+@pytest.mark.parametrize('flags', [True, False])
+def test_auto_phase_masks_the_cycle_with_a_dropped_frame(tmp_path, flags):
+    data = synthetic_data(300)
+    path = tmp_path / 'raw.csv'
+    write_raw(path, data)
+    clean = parsing.file_reader(path, use_cache=False)
+
+    # drop the isosbestic frame of cycle 10 (rows 54 to 56)
+    dropped = np.delete(data, parsing.START_ROWS['isosbestic'] + 30, axis=0)
+    if not flags:
+        dropped[:, parsing.LED_COLUMN] = 0
+    write_raw(path, dropped)
+    labels, valid = parsing.detect_phase(dropped)
+    assert not valid[54:56].any()
+    assert valid[24:54].all() and valid[56:-1].all()
+    assert list(labels[53:58]) == [2, 0, 2, 0, 1]
+
+    auto = parsing.file_reader(path, use_cache=False, phase='auto')
+    config = parsing.file_reader(path, use_cache=False)
+    for name in parsing.CHANNEL_NAMES:
+        assert np.array_equal(auto[name], np.delete(clean[name], 10))
+    # without phase detection every later green sample is shifted
+    assert not np.array_equal(config.fTimeGreen[11:], clean.fTimeGreen[11:])
+
+
+@pytest.mark.parametrize('t_start, t_stop', [
+    (32468000 + 25 * 1500.5, 32468000 + 25 * 3700),
+    (None, 32468000 + 25 * 999),
+    (32468000 + 25 * 4000, None),
+    (32468000 + 25 * 2000, 32468000 + 25 * 2000),
+    (0, 1),
+    (None, None)])
+def test_time_range_matches_whole_file(tmp_path, t_start, t_stop):
+    path = tmp_path / 'raw.csv'
+    write_raw(path, synthetic_data(5000))
+    whole = parsing.file_reader(path, use_cache=False)
+    low = -np.inf if t_start is None else t_start
+    high = np.inf if t_stop is None else t_stop
+    # the second call reads the index back from the cache
+    for _ in range(2):
+        part = parsing.file_reader(path, cache_dir=tmp_path / 'cache',
+                                   t_start=t_start, t_stop=t_stop)
+        for name, _, channel, _ in parsing.CHANNELS:
+            ftime = whole['fTime' + channel.capitalize()]
+            keep = (ftime >= low) & (ftime <= high)
+            assert np.array_equal(part[name], whole[name][keep])
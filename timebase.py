@@ -0,0 +1,135 @@
+#!/usr/bin/python3
+"""
+Contains the Timebase class, which describes the timestamps of one
+channel (such as fTimeGreen). The Neurophotometrics rig samples each
+channel at a nearly constant rate, so the sample rate and jitter are
+measured once and times are turned into sample locations with
+arithmetic instead of a search. If the jitter is too large, it falls
+back to the binary search in allfunctions.nearest_index.
+"""
+
+import numpy as np
+import allfunctions
+
+
+class Timebase:
+    """
+    The timestamps of one channel and their sample rate.
+
+    Parameters
+    ----------
+    times: array
+        This array holds the timestamps, in increasing order.
+
+    scale: float
+        The number of timestamp units in one second. The rig writes
+        timestamps in ms, so the default is 1000.
+
+    tolerance: float
+        The largest jitter, as a fraction of the sample period, for
+        which the arithmetic lookup is used. It must be below 0.5 for
+        the lookup to give the same locations as the search.
+    """
+    __slots__ = ('times', 'scale', 'start', 'period', 'jitter', 'uniform')
+
+    def __init__(self, times, scale=1000.0, tolerance=0.25):
+        self.times = np.asarray(times, dtype=float).ravel()
+        self.scale = scale
+        if len(self.times) == 0:
+            raise ValueError("times should not be empty")
+        self.start = self.times[0]
+        if len(self.times) > 1:
+            self.period = ((self.times[-1] - self.times[0]) /
+                           (len(self.times) - 1))
+            grid = self.start + self.period * np.arange(len(self.times))
+            self.jitter = np.abs(self.times - grid).max()
+        else:
+            self.period, self.jitter = np.nan, 0.0
+        self.uniform = bool(self.period > 0 and
+                            self.jitter <= tolerance * self.period)
+
+    def __len__(self):
+        return len(self.times)
+
+    def __repr__(self):
+        return (f"Timebase({len(self.times)} samples, "
+                f"{self.sample_rate:.3f} Hz, jitter {self.jitter:.3g})")
+
+    @property
+    def sample_rate(self):
+        """
+        Objective: To give the number of samples per second.
+        """
+        return self.scale / self.period
+
+    def index(self, times, flag_outside=False):
+        """
+        Objective: To find the sample closest to each time. This gives
+        the same locations as allfunctions.nearest_index, including
+        a tie going to the earlier sample.
+
+        Parameters
+        ----------
+        times: array
+            The times to look up, in timestamp units.
+
+        flag_outside: bool
+            If True, also return which times are inside the recording.
+
+
+        Returns
+        -------
+        near_loc: array
+            This array of integers holds the closest sample to each time.
+
+        inside: array
+            Only returned if flag_outside is True. This boolean array is
+            False for times before the first or after the last sample.
+        """
+        if not self.uniform:
+            return allfunctions.nearest_index(self.times, times,
+                                              flag_outside)
+        times = np.atleast_1d(np.asarray(times, dtype=float)).ravel()
+        last = len(self.times) - 1
+        guess = np.rint((times - self.start) / self.period)
+        guess = np.clip(np.nan_to_num(guess), 0, last).astype(np.intp)
+        # with jitter under half a period the closest sample is
+        # the guess or one of its neighbours
+        candidates = np.clip(guess[:, None] + np.array([-1, 0, 1]), 0, last)
+        distance = np.abs(self.times[candidates] - times[:, None])
+        near_loc = candidates[np.arange(len(times)),
+                              np.argmin(distance, axis=1)]
+        near_loc[np.isnan(times)] = 0
+        if flag_outside:
+            inside = (times >= self.times[0]) & (times <= self.times[-1])
+            return near_loc, inside
+        return near_loc
+
+    def time(self, index):
+        """
+        Objective: To give the timestamp of each sample location.
+        """
+        return self.times[index]
+
+    def samples(self, seconds):
+        """
+        Objective: To give the number of samples closest to a duration.
+
+        Parameters
+        ----------
+        seconds: float
+            The duration in seconds.
+
+
+        Returns
+        -------
+        samples: int
+            The number of samples in that duration at the sample rate.
+        """
+        return int(round(seconds * self.sample_rate))
+
+    def seconds(self, samples):
+        """
+        Objective: To give the duration of a number of samples in seconds.
+        """
+        return samples / self.sample_rate